@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     # Database
@@ -13,6 +14,29 @@ class Settings(BaseSettings):
     # API
     API_PREFIX: str = "/api/v1"
     
+    # Intraday prices
+    INTRADAY_INTERVAL: str = "5m"
+    INTRADAY_BUFFER_SIZE: int = 80
+    
+    # Sharded price refresh
+    PRICE_REFRESH_SHARD_SIZE: int = 25
+    PRICE_REFRESH_LEASE_SECONDS: int = 120
+    PRICE_REFRESH_MAX_ATTEMPTS: int = 3
+    PRICE_REFRESH_WORKERS: int = 2
+    PRICE_REFRESH_POLL_SECONDS: float = 10.0
+    
+    # Delta-sync: days a removed holding's tombstone is kept
+    TOMBSTONE_RETENTION_DAYS: int = 30
+    
+    # Per-request profiling (off unless PROFILING_ENABLED)
+    PROFILING_ENABLED: bool = False
+    PROFILING_HEADER: str = "X-Profile"
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_SLOW_MS: float = 0.0
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_PROFILES: int = 100
+    PROFILING_ADMIN_TOKEN: Optional[str] = None
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
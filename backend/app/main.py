@@ -1,7 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+import random
+import threading
+import time
 from .config import settings
-from .routes import clients, holdings, prices, portfolio
+from .database import engine
+from .routes import clients, holdings, prices, portfolio, alerts, profiles
+from .services.profiling_service import ProfilingService, RequestProfile, current_profile
+from .services.refresh_service import PriceRefreshService
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -24,6 +31,56 @@ app.include_router(clients.router, prefix=settings.API_PREFIX)
 app.include_router(holdings.router, prefix=settings.API_PREFIX)
 app.include_router(prices.router, prefix=settings.API_PREFIX)
 app.include_router(portfolio.router, prefix=settings.API_PREFIX)
+app.include_router(alerts.router, prefix=settings.API_PREFIX)
+app.include_router(profiles.router, prefix=settings.API_PREFIX)
+
+def _profile_trigger(request: Request):
+    """Why this request should be profiled, or None"""
+    # The header trigger needs the admin token, so it is off when none is configured
+    if ProfilingService.is_admin_token(request.headers.get(settings.PROFILING_HEADER)):
+        return "header"
+    if settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return "sample"
+    if settings.PROFILING_SLOW_MS > 0:
+        return "slow"
+    return None
+
+# Profiling hooks are only installed when enabled, so they cost nothing otherwise
+if settings.PROFILING_ENABLED:
+    ProfilingService.install(app, engine)
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        trigger = _profile_trigger(request)
+        if trigger is None:
+            return await call_next(request)
+        
+        profile = RequestProfile(request.method, request.url.path, trigger)
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            current_profile.reset(token)
+        duration_ms = (time.perf_counter() - started) * 1000
+        
+        # The latency trigger profiles every request but keeps only the slow ones
+        if trigger != "slow" or duration_ms >= settings.PROFILING_SLOW_MS:
+            await run_in_threadpool(ProfilingService.save, profile, response.status_code, duration_ms)
+            response.headers["X-Profile-Id"] = profile.id
+        return response
+
+# Every replica polls for price refresh shards planned by any other one
+_refresh_poller_stop = threading.Event()
+
+@app.on_event("startup")
+def start_price_refresh_poller():
+    if settings.PRICE_REFRESH_POLL_SECONDS > 0:
+        PriceRefreshService.start_poller(_refresh_poller_stop)
+
+@app.on_event("shutdown")
+def stop_price_refresh_poller():
+    _refresh_poller_stop.set()
 
 @app.get("/")
 def root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, Numeric, ForeignKey, BigInteger, CheckConstraint
+from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, Numeric, ForeignKey, BigInteger, CheckConstraint, Boolean, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -21,10 +21,11 @@ class Holding(Base):
     
     id = Column(BigInteger, primary_key=True, index=True)
     client_id = Column(BigInteger, ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
-    symbol = Column(Text, nullable=False)
+    symbol = Column(Text, nullable=False, index=True)
     company_name = Column(Text, nullable=False)
     quantity = Column(Integer, nullable=False)
     exchange = Column(Text, default="NSE")
+    change_version = Column(BigInteger, nullable=False, default=0, server_default="0")
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
     
@@ -39,10 +40,107 @@ class Holding(Base):
 class PriceCache(Base):
     __tablename__ = "price_cache"
     
+    # One row per listing: the same symbol on NSE and BSE is cached separately
     symbol = Column(Text, primary_key=True)
+    exchange = Column(Text, primary_key=True, default="NSE")
     live_price = Column(Numeric(12, 2))
     yesterday_price = Column(Numeric(12, 2))
     price_30d_ago = Column(Numeric(12, 2))
     price_1y_ago = Column(Numeric(12, 2))
     last_updated = Column(TIMESTAMP, server_default=func.now())
-    exchange = Column(Text, default="NSE")
\ No newline at end of file
+    # Set when the last fetch for this listing failed; valuation then falls back to the other listing
+    is_stale = Column(Boolean, nullable=False, default=False, server_default="false")
+
+class ClientPortfolioTotals(Base):
+    """Per-client portfolio totals, maintained incrementally by PortfolioTotalsService"""
+    __tablename__ = "client_portfolio_totals"
+    
+    client_id = Column(BigInteger, ForeignKey("clients.id", ondelete="CASCADE"), primary_key=True)
+    current_value = Column(Numeric(18, 2), nullable=False, default=0)
+    yesterday_value = Column(Numeric(18, 2), nullable=False, default=0)
+    value_30d_ago = Column(Numeric(18, 2), nullable=False, default=0)
+    value_1y_ago = Column(Numeric(18, 2), nullable=False, default=0)
+    num_holdings = Column(Integer, nullable=False, default=0)
+    version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    # Highest tombstone version pruned; delta-sync from below it needs a full resync
+    tombstones_pruned_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+class HoldingTombstone(Base):
+    """Removed holdings, so delta-sync clients can drop them"""
+    __tablename__ = "holding_tombstones"
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    holding_id = Column(BigInteger, nullable=False)
+    client_id = Column(BigInteger, ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+    symbol = Column(Text, nullable=False)
+    version = Column(BigInteger, nullable=False)
+    deleted_at = Column(TIMESTAMP, server_default=func.now())
+
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    scope = Column(Text, nullable=False)
+    symbol = Column(Text)
+    client_id = Column(BigInteger, ForeignKey("clients.id", ondelete="CASCADE"))
+    metric = Column(Text, nullable=False)
+    direction = Column(Text, nullable=False)
+    threshold = Column(Numeric(18, 2), nullable=False)
+    is_active = Column(Boolean, nullable=False, default=True)
+    last_triggered_at = Column(TIMESTAMP)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        CheckConstraint("scope IN ('symbol', 'client')", name='check_alert_scope_valid'),
+        CheckConstraint("direction IN ('above', 'below')", name='check_alert_direction_valid'),
+    )
+
+class AlertEvent(Base):
+    __tablename__ = "alert_events"
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    rule_id = Column(BigInteger, ForeignKey("alert_rules.id", ondelete="CASCADE"), nullable=False, index=True)
+    client_id = Column(BigInteger, ForeignKey("clients.id", ondelete="CASCADE"), index=True)
+    symbol = Column(Text)
+    metric = Column(Text, nullable=False)
+    observed_value = Column(Numeric(18, 2), nullable=False)
+    threshold = Column(Numeric(18, 2), nullable=False)
+    message = Column(Text, nullable=False)
+    triggered_at = Column(TIMESTAMP, server_default=func.now(), index=True)
+
+class PriceRefreshRun(Base):
+    __tablename__ = "price_refresh_runs"
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    status = Column(Text, nullable=False, default="running")
+    total_shards = Column(Integer, nullable=False)
+    total_symbols = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    finished_at = Column(TIMESTAMP)
+    
+    shards = relationship("PriceRefreshShard", back_populates="run", cascade="all, delete-orphan")
+
+class PriceRefreshShard(Base):
+    __tablename__ = "price_refresh_shards"
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    run_id = Column(BigInteger, ForeignKey("price_refresh_runs.id", ondelete="CASCADE"), nullable=False, index=True)
+    shard_no = Column(Integer, nullable=False)
+    listings = Column(JSON, nullable=False)
+    status = Column(Text, nullable=False, default="pending")
+    lease_owner = Column(Text)
+    lease_expires_at = Column(TIMESTAMP)
+    attempts = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    started_at = Column(TIMESTAMP)
+    finished_at = Column(TIMESTAMP)
+    
+    run = relationship("PriceRefreshRun", back_populates="shards")
+    
+    __table_args__ = (
+        CheckConstraint("status IN ('pending', 'running', 'done', 'failed')", name='check_shard_status_valid'),
+    )
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from decimal import Decimal
 
@@ -57,12 +57,14 @@ class PriceData(BaseModel):
     price_1y_ago: Optional[Decimal] = None
     last_updated: Optional[datetime] = None
     exchange: str = "NSE"
+    is_stale: bool = False
     
     class Config:
         from_attributes = True
 
 class PriceUpdateRequest(BaseModel):
     symbol: str
+    exchange: str = Field(default="NSE", pattern="^(NSE|BSE)$")
     live_price: Decimal = Field(..., ge=0)
     yesterday_price: Optional[Decimal] = Field(None, ge=0)
     price_30d_ago: Optional[Decimal] = Field(None, ge=0)
@@ -96,4 +98,70 @@ class PortfolioSummary(BaseModel):
     total_day_change: Decimal
     total_day_change_percent: Decimal
     holdings: List[PortfolioHolding]
-    last_updated: datetime
\ No newline at end of file
+    last_updated: datetime
+    version: Optional[int] = None
+
+class PortfolioTotals(BaseModel):
+    client_id: int
+    total_current_value: Decimal
+    total_yesterday_value: Decimal
+    total_value_30d_ago: Decimal
+    total_value_1y_ago: Decimal
+    total_day_change: Decimal
+    total_day_change_percent: Decimal
+    num_holdings: int
+    version: int = 0
+    last_updated: Optional[datetime]
+
+class PortfolioChanges(BaseModel):
+    client_id: int
+    since: int
+    version: int
+    full: bool
+    changed: List[PortfolioHolding]
+    removed: List[int]
+    totals: PortfolioTotals
+
+# ===== ALERT SCHEMAS =====
+class AlertRuleCreate(BaseModel):
+    scope: str = Field(..., pattern="^(symbol|client)$")
+    symbol: Optional[str] = Field(None, min_length=1, max_length=50)
+    client_id: Optional[int] = None
+    metric: str = Field(..., pattern="^(day_change_percent|live_price|portfolio_value)$")
+    direction: str = Field(..., pattern="^(above|below)$")
+    threshold: Decimal
+
+class AlertRuleResponse(AlertRuleCreate):
+    id: int
+    is_active: bool
+    last_triggered_at: Optional[datetime] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class AlertEventResponse(BaseModel):
+    id: int
+    rule_id: int
+    client_id: Optional[int]
+    symbol: Optional[str]
+    metric: str
+    observed_value: Decimal
+    threshold: Decimal
+    message: str
+    triggered_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# ===== SCENARIO SCHEMAS =====
+class ScenarioSpec(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+    shocks: Dict[str, float] = Field(default_factory=dict, description="Percent price change per symbol")
+    market_shock_percent: float = Field(0.0, description="Percent change applied to symbols without their own shock")
+    target_weights: Optional[Dict[str, float]] = Field(None, description="Rebalance to these weights (sum <= 1, rest is cash)")
+
+class ScenarioRequest(BaseModel):
+    scenarios: List[ScenarioSpec] = Field(..., min_length=1, max_length=100)
+    client_ids: Optional[List[int]] = None
+    include_trades: bool = True
\ No newline at end of file
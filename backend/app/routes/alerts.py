@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+from ..database import get_db
+from ..models import AlertRule, AlertEvent, Client
+from ..models.schemas import AlertRuleCreate, AlertRuleResponse, AlertEventResponse
+from ..services.alert_service import AlertService, SYMBOL_METRICS, CLIENT_METRICS
+
+router = APIRouter(prefix="/alerts", tags=["Alerts"])
+
+@router.post("/rules", response_model=AlertRuleResponse, status_code=status.HTTP_201_CREATED)
+def create_alert_rule(rule: AlertRuleCreate, db: Session = Depends(get_db)):
+    """Create a price or portfolio threshold rule"""
+    if rule.scope == "symbol":
+        if not rule.symbol or rule.metric not in SYMBOL_METRICS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Symbol rules need a symbol and one of {', '.join(SYMBOL_METRICS)}"
+            )
+    elif rule.client_id is None or rule.metric not in CLIENT_METRICS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Client rules need a client_id and one of {', '.join(CLIENT_METRICS)}"
+        )
+
+    if rule.client_id is not None:
+        client = db.query(Client).filter(Client.id == rule.client_id).first()
+        if not client:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Client with id {rule.client_id} not found"
+            )
+
+    db_rule = AlertRule(**rule.model_dump())
+    db.add(db_rule)
+    db.commit()
+    db.refresh(db_rule)
+    return db_rule
+
+@router.get("/rules", response_model=List[AlertRuleResponse])
+def list_alert_rules(
+    client_id: Optional[int] = None,
+    symbol: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """List alert rules, optionally for one client or symbol"""
+    query = db.query(AlertRule)
+    if client_id is not None:
+        query = query.filter(AlertRule.client_id == client_id)
+    if symbol:
+        query = query.filter(AlertRule.symbol == symbol)
+    return query.order_by(AlertRule.id).offset(skip).limit(limit).all()
+
+@router.delete("/rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_alert_rule(rule_id: int, db: Session = Depends(get_db)):
+    """Delete an alert rule (and its logged alerts)"""
+    db_rule = db.query(AlertRule).filter(AlertRule.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Alert rule with id {rule_id} not found"
+        )
+
+    db.delete(db_rule)
+    db.commit()
+    return None
+
+@router.get("/events", response_model=List[AlertEventResponse])
+def list_alert_events(
+    client_id: Optional[int] = None,
+    symbol: Optional[str] = None,
+    rule_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Query the log of fired alerts, newest first"""
+    query = db.query(AlertEvent)
+    if client_id is not None:
+        query = query.filter(AlertEvent.client_id == client_id)
+    if symbol:
+        query = query.filter(AlertEvent.symbol == symbol)
+    if rule_id is not None:
+        query = query.filter(AlertEvent.rule_id == rule_id)
+    if since:
+        query = query.filter(AlertEvent.triggered_at >= since)
+    return query.order_by(AlertEvent.triggered_at.desc()).offset(skip).limit(limit).all()
+
+@router.post("/evaluate")
+def evaluate_alerts(db: Session = Depends(get_db)):
+    """Evaluate all active rules against current prices now"""
+    fired = AlertService.evaluate(db)
+    return {"message": "Alert evaluation complete", "alerts_fired": fired}
@@ -4,6 +4,8 @@ from typing import List
 from ..database import get_db
 from ..models import Holding, Client
 from ..models.schemas import HoldingCreate, HoldingUpdate, HoldingResponse
+from ..services.portfolio_totals_service import PortfolioTotalsService
+from ..services.intraday_service import IntradayService
 
 router = APIRouter(prefix="/holdings", tags=["Holdings"])
 
@@ -30,6 +32,7 @@ def create_holding(holding: HoldingCreate, db: Session = Depends(get_db)):
     
     db_holding = Holding(**holding.model_dump())
     db.add(db_holding)
+    PortfolioTotalsService.on_position_change(db, db_holding, db_holding.quantity, holdings_delta=1)
     db.commit()
     db.refresh(db_holding)
     return db_holding
@@ -58,20 +61,38 @@ def get_holding(holding_id: int, db: Session = Depends(get_db)):
         )
     return holding
 
+@router.get("/{holding_id}/intraday")
+def get_holding_intraday(holding_id: int, db: Session = Depends(get_db)):
+    """Get intraday price bars (sparkline) for a holding"""
+    holding = db.query(Holding).filter(Holding.id == holding_id).first()
+    if not holding:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Holding with id {holding_id} not found"
+        )
+    
+    sparkline = IntradayService.sparkline(holding.symbol, holding.exchange)
+    sparkline["holding_id"] = holding.id
+    sparkline["quantity"] = holding.quantity
+    return sparkline
+
 @router.put("/{holding_id}", response_model=HoldingResponse)
 def update_holding(holding_id: int, holding_update: HoldingUpdate, db: Session = Depends(get_db)):
     """Update a holding (e.g., change quantity)"""
-    db_holding = db.query(Holding).filter(Holding.id == holding_id).first()
+    db_holding = PortfolioTotalsService.lock_holding(db, holding_id)
     if not db_holding:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Holding with id {holding_id} not found"
         )
     
+    old_quantity = db_holding.quantity
     update_data = holding_update.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_holding, key, value)
     
+    PortfolioTotalsService.on_position_change(db, db_holding, db_holding.quantity - old_quantity)
+    
     db.commit()
     db.refresh(db_holding)
     return db_holding
@@ -79,13 +100,14 @@ def update_holding(holding_id: int, holding_update: HoldingUpdate, db: Session =
 @router.delete("/{holding_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_holding(holding_id: int, db: Session = Depends(get_db)):
     """Remove a holding from portfolio"""
-    db_holding = db.query(Holding).filter(Holding.id == holding_id).first()
+    db_holding = PortfolioTotalsService.lock_holding(db, holding_id)
     if not db_holding:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Holding with id {holding_id} not found"
         )
     
+    PortfolioTotalsService.on_position_removed(db, db_holding)
     db.delete(db_holding)
     db.commit()
     return None
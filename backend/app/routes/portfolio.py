@@ -1,17 +1,76 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List
+from typing import List, Optional
 from decimal import Decimal
 from ..database import get_db
-from ..models import Client
-from ..models.schemas import PortfolioSummary, PortfolioHolding
+from ..models import Client, ClientPortfolioTotals
+from ..models.schemas import PortfolioSummary, PortfolioHolding, PortfolioTotals, PortfolioChanges, ScenarioRequest
 from ..services.pdf_service import PDFService
+from ..services.portfolio_totals_service import PortfolioTotalsService
+from ..services.export_service import ExportService
+from ..services.risk_service import RiskService
+from ..services.scenario_service import ScenarioService, ScenarioError
 from datetime import datetime
 
 router = APIRouter(prefix="/portfolio", tags=["Portfolio"])
 
+def build_portfolio_holding(row) -> PortfolioHolding:
+    """Convert a portfolio_view row into a PortfolioHolding"""
+    return PortfolioHolding(
+        id=row.id,
+        symbol=row.symbol,
+        company_name=row.company_name,
+        exchange=row.exchange,
+        quantity=row.quantity,
+        live_price=row.live_price,
+        yesterday_price=row.yesterday_price,
+        price_30d_ago=row.price_30d_ago,
+        price_1y_ago=row.price_1y_ago,
+        current_value=row.current_value or Decimal("0.00"),
+        yesterday_value=row.yesterday_value or Decimal("0.00"),
+        value_30d_ago=row.value_30d_ago or Decimal("0.00"),
+        value_1y_ago=row.value_1y_ago or Decimal("0.00"),
+        day_change=row.day_change or Decimal("0.00"),
+        day_change_percent=row.day_change_percent or Decimal("0.00"),
+        price_updated_at=row.price_updated_at
+    )
+
+def build_portfolio_totals(client_id: int, totals: Optional[ClientPortfolioTotals]) -> PortfolioTotals:
+    """Convert a client_portfolio_totals row (or its absence) into PortfolioTotals"""
+    if not totals:
+        return PortfolioTotals(
+            client_id=client_id,
+            total_current_value=Decimal("0.00"),
+            total_yesterday_value=Decimal("0.00"),
+            total_value_30d_ago=Decimal("0.00"),
+            total_value_1y_ago=Decimal("0.00"),
+            total_day_change=Decimal("0.00"),
+            total_day_change_percent=Decimal("0.00"),
+            num_holdings=0,
+            version=0,
+            last_updated=None
+        )
+    
+    total_change = totals.current_value - totals.yesterday_value
+    total_change_percent = Decimal("0.00")
+    if totals.yesterday_value > 0:
+        total_change_percent = (total_change / totals.yesterday_value) * 100
+    
+    return PortfolioTotals(
+        client_id=client_id,
+        total_current_value=totals.current_value,
+        total_yesterday_value=totals.yesterday_value,
+        total_value_30d_ago=totals.value_30d_ago,
+        total_value_1y_ago=totals.value_1y_ago,
+        total_day_change=total_change,
+        total_day_change_percent=round(total_change_percent, 2),
+        num_holdings=totals.num_holdings,
+        version=totals.version,
+        last_updated=totals.updated_at
+    )
+
 @router.get("/client/{client_id}", response_model=PortfolioSummary)
 def get_client_portfolio(client_id: int, db: Session = Depends(get_db)):
     """Get complete portfolio for a client with calculated values"""
@@ -23,6 +82,9 @@ def get_client_portfolio(client_id: int, db: Session = Depends(get_db)):
             detail=f"Client with id {client_id} not found"
         )
     
+    # Read the version before the rows so a concurrent change is resent, never missed
+    version = db.query(ClientPortfolioTotals.version).filter(ClientPortfolioTotals.client_id == client_id).scalar() or 0
+    
     query = text("""
         SELECT * FROM portfolio_view 
         WHERE client_id = :client_id
@@ -42,7 +104,8 @@ def get_client_portfolio(client_id: int, db: Session = Depends(get_db)):
             total_day_change=Decimal("0.00"),
             total_day_change_percent=Decimal("0.00"),
             holdings=[],
-            last_updated=datetime.now()
+            last_updated=datetime.now(),
+            version=version
         )
     
     holdings = []
@@ -50,24 +113,7 @@ def get_client_portfolio(client_id: int, db: Session = Depends(get_db)):
     total_yesterday = Decimal("0.00")
     
     for row in rows:
-        holding = PortfolioHolding(
-            id=row.id,
-            symbol=row.symbol,
-            company_name=row.company_name,
-            exchange=row.exchange,
-            quantity=row.quantity,
-            live_price=row.live_price,
-            yesterday_price=row.yesterday_price,
-            price_30d_ago=row.price_30d_ago,
-            price_1y_ago=row.price_1y_ago,
-            current_value=row.current_value or Decimal("0.00"),
-            yesterday_value=row.yesterday_value or Decimal("0.00"),
-            value_30d_ago=row.value_30d_ago or Decimal("0.00"),
-            value_1y_ago=row.value_1y_ago or Decimal("0.00"),
-            day_change=row.day_change or Decimal("0.00"),
-            day_change_percent=row.day_change_percent or Decimal("0.00"),
-            price_updated_at=row.price_updated_at
-        )
+        holding = build_portfolio_holding(row)
         holdings.append(holding)
         total_current += holding.current_value
         total_yesterday += holding.yesterday_value
@@ -86,7 +132,8 @@ def get_client_portfolio(client_id: int, db: Session = Depends(get_db)):
         total_day_change=total_change,
         total_day_change_percent=round(total_change_percent, 2),
         holdings=holdings,
-        last_updated=datetime.now()
+        last_updated=datetime.now(),
+        version=version
     )
 
 @router.get("/export/{client_id}")
@@ -132,40 +179,195 @@ def export_portfolio_pdf(client_id: int, db: Session = Depends(get_db)):
         }
     )
 
+@router.get("/export-all")
+def export_all_holdings(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    compress: bool = True,
+    exchange: Optional[str] = Query(None, pattern="^(NSE|BSE)$"),
+    symbol: Optional[str] = None,
+    client_id: Optional[int] = None
+):
+    """Stream every holding with its valuation as CSV or NDJSON (gzipped by default)"""
+    
+    filename = f"holdings_{datetime.now().strftime('%Y%m%d')}.{format}"
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        ExportService.stream_holdings(
+            format, compress, exchange=exchange, symbol=symbol, client_id=client_id
+        ),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        }
+    )
+
+@router.get("/client/{client_id}/totals", response_model=PortfolioTotals)
+def get_client_totals(client_id: int, db: Session = Depends(get_db)):
+    """Get a client's portfolio totals from the incrementally maintained aggregate"""
+    
+    client = db.query(Client).filter(Client.id == client_id).first()
+    if not client:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Client with id {client_id} not found"
+        )
+    
+    totals = db.query(ClientPortfolioTotals).filter(ClientPortfolioTotals.client_id == client_id).first()
+    return build_portfolio_totals(client_id, totals)
+
+@router.get("/client/{client_id}/changes", response_model=PortfolioChanges)
+def get_client_portfolio_changes(client_id: int, since: int = Query(0, ge=0), db: Session = Depends(get_db)):
+    """
+    Holdings added, changed or removed since a version returned by a previous poll,
+    plus current totals. since=0, an unknown future version, or a version older than
+    the pruned tombstones (TOMBSTONE_RETENTION_DAYS) returns everything.
+    """
+    
+    client = db.query(Client).filter(Client.id == client_id).first()
+    if not client:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Client with id {client_id} not found"
+        )
+    
+    totals = db.query(ClientPortfolioTotals).filter(ClientPortfolioTotals.client_id == client_id).first()
+    version = totals.version if totals else 0
+    pruned_version = totals.tombstones_pruned_version if totals else 0
+    full = since == 0 or since > version or since < pruned_version
+    
+    if not full and since == version:
+        changed_rows, removed = [], []
+    else:
+        query = text(f"""
+            SELECT v.* FROM portfolio_view v
+            {"" if full else "JOIN holdings h ON h.id = v.id AND h.change_version > :since"}
+            WHERE v.client_id = :client_id
+            ORDER BY v.symbol
+        """)
+        changed_rows = db.execute(query, {"client_id": client_id, "since": since}).fetchall()
+        removed = [] if full else db.execute(text("""
+            SELECT holding_id FROM holding_tombstones
+            WHERE client_id = :client_id AND version > :since
+            ORDER BY version
+        """), {"client_id": client_id, "since": since}).scalars().all()
+    
+    return PortfolioChanges(
+        client_id=client_id,
+        since=since,
+        version=version,
+        full=full,
+        changed=[build_portfolio_holding(row) for row in changed_rows],
+        removed=removed,
+        totals=build_portfolio_totals(client_id, totals)
+    )
+
+@router.post("/totals/rebuild")
+def rebuild_portfolio_totals(client_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Recompute client_portfolio_totals from portfolio_view (backfill / drift repair) and prune old tombstones"""
+    PortfolioTotalsService.rebuild(db, client_id)
+    pruned = PortfolioTotalsService.prune_tombstones(db, client_id)
+    db.commit()
+    return {"message": "Portfolio totals rebuilt", "client_id": client_id, "tombstones_pruned": pruned}
+
 @router.get("/dashboard")
 def get_dashboard_summary(db: Session = Depends(get_db)):
     """Get overall dashboard with all clients and total values"""
     
-    clients = db.query(Client).all()
+    query = text("""
+        SELECT c.id AS client_id,
+               c.name AS client_name,
+               COALESCE(t.current_value, 0) AS current_value,
+               COALESCE(t.yesterday_value, 0) AS yesterday_value,
+               COALESCE(t.num_holdings, 0) AS num_holdings
+        FROM clients c
+        LEFT JOIN client_portfolio_totals t ON t.client_id = c.id
+        ORDER BY c.id
+    """)
+    rows = db.execute(query).fetchall()
     
     total_portfolio_value = Decimal("0.00")
     total_day_change = Decimal("0.00")
     client_summaries = []
     
-    for client in clients:
-        portfolio = get_client_portfolio(client.id, db)
+    for row in rows:
+        day_change = row.current_value - row.yesterday_value
+        day_change_percent = Decimal("0.00")
+        if row.yesterday_value > 0:
+            day_change_percent = (day_change / row.yesterday_value) * 100
         
         client_summaries.append({
-            "client_id": client.id,
-            "client_name": client.name,
-            "portfolio_value": portfolio.total_current_value,
-            "day_change": portfolio.total_day_change,
-            "day_change_percent": portfolio.total_day_change_percent,
-            "num_holdings": len(portfolio.holdings)
+            "client_id": row.client_id,
+            "client_name": row.client_name,
+            "portfolio_value": row.current_value,
+            "day_change": day_change,
+            "day_change_percent": round(day_change_percent, 2),
+            "num_holdings": row.num_holdings
         })
         
-        total_portfolio_value += portfolio.total_current_value
-        total_day_change += portfolio.total_day_change
+        total_portfolio_value += row.current_value
+        total_day_change += day_change
     
     total_change_percent = Decimal("0.00")
     if total_portfolio_value > 0:
         total_change_percent = (total_day_change / (total_portfolio_value - total_day_change)) * 100
     
     return {
-        "total_clients": len(clients),
+        "total_clients": len(rows),
         "total_portfolio_value": total_portfolio_value,
         "total_day_change": total_day_change,
         "total_day_change_percent": round(total_change_percent, 2),
         "clients": client_summaries,
         "last_updated": datetime.now()
     }
+
+@router.get("/risk")
+def get_firm_risk(
+    horizon_days: int = Query(1, ge=1, le=250),
+    top_pairs: int = Query(5, ge=0, le=50),
+    db: Session = Depends(get_db)
+):
+    """Volatility, parametric/historical VaR and top correlated pairs for every client book"""
+    return RiskService.client_report(db, horizon_days=horizon_days, top_pairs=top_pairs)
+
+@router.get("/risk/client/{client_id}")
+def get_client_risk(
+    client_id: int,
+    horizon_days: int = Query(1, ge=1, le=250),
+    top_pairs: int = Query(5, ge=0, le=50),
+    db: Session = Depends(get_db)
+):
+    """Risk figures for a single client's book"""
+    
+    client = db.query(Client).filter(Client.id == client_id).first()
+    if not client:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Client with id {client_id} not found"
+        )
+    
+    report = RiskService.client_report(db, client_id=client_id, horizon_days=horizon_days, top_pairs=top_pairs)
+    client_risk = report["clients"][0] if report["clients"] else {
+        "client_id": client_id,
+        "client_name": client.name,
+        "portfolio_value": 0.0
+    }
+    return {
+        "horizon_days": horizon_days,
+        "model_computed_at": report["model_computed_at"],
+        **client_risk
+    }
+
+@router.post("/scenarios")
+def run_scenarios(request: ScenarioRequest, db: Session = Depends(get_db)):
+    """Evaluate price shocks and rebalancing targets across one, several or all client books"""
+    try:
+        return ScenarioService.simulate(db, request)
+    except ScenarioError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
\ No newline at end of file
@@ -1,18 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..database import get_db
-from ..models import PriceCache, Holding
+from ..models import PriceCache
 from ..models.schemas import PriceData, PriceUpdateRequest
 from ..services.stock_service import StockPriceService
+from ..services.portfolio_totals_service import PortfolioTotalsService
+from ..services.alert_service import AlertService
+from ..services.intraday_service import IntradayService
+from ..services.refresh_service import PriceRefreshService
+from ..services.price_cache_service import PriceCacheService
 from datetime import datetime
 
 router = APIRouter(prefix="/prices", tags=["Prices"])
 
 @router.get("/{symbol}", response_model=PriceData)
-def get_price(symbol: str, db: Session = Depends(get_db)):
-    """Get cached price for a symbol"""
-    price = db.query(PriceCache).filter(PriceCache.symbol == symbol).first()
+def get_price(symbol: str, exchange: str = Query("NSE", pattern="^(NSE|BSE)$"), db: Session = Depends(get_db)):
+    """Get the cached price a holding of symbol on exchange is valued at (falls back to the other listing)"""
+    price = PriceCacheService.resolve(db, symbol, exchange)
     if not price:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -21,9 +26,14 @@ def get_price(symbol: str, db: Session = Depends(get_db)):
     return price
 
 @router.post("/update", response_model=PriceData)
-def manual_price_update(price_update: PriceUpdateRequest, db: Session = Depends(get_db)):
-    """Manually update price for a symbol"""
-    price = db.query(PriceCache).filter(PriceCache.symbol == price_update.symbol).first()
+def manual_price_update(
+    price_update: PriceUpdateRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Manually update price for a symbol on one exchange"""
+    before = PortfolioTotalsService.symbol_snapshot(db, price_update.symbol)
+    price = PriceCacheService.get_listing(db, price_update.symbol, price_update.exchange)
     
     if price:
         price.live_price = price_update.live_price
@@ -34,77 +44,69 @@ def manual_price_update(price_update: PriceUpdateRequest, db: Session = Depends(
         if price_update.price_1y_ago:
             price.price_1y_ago = price_update.price_1y_ago
         price.last_updated = datetime.now()
+        price.is_stale = False
     else:
         price = PriceCache(**price_update.model_dump(), last_updated=datetime.now())
         db.add(price)
     
+    PortfolioTotalsService.on_listing_change(db, price_update.symbol, before, price)
     db.commit()
     db.refresh(price)
+    background_tasks.add_task(AlertService.evaluate_symbol, price_update.symbol)
     return price
 
 @router.post("/refresh/{symbol}", response_model=PriceData)
-def refresh_price_from_api(symbol: str, exchange: str = "NSE", db: Session = Depends(get_db)):
+def refresh_price_from_api(
+    symbol: str,
+    background_tasks: BackgroundTasks,
+    exchange: str = Query("NSE", pattern="^(NSE|BSE)$"),
+    db: Session = Depends(get_db)
+):
     """Fetch latest price from Yahoo Finance and update cache"""
     price_data = StockPriceService.fetch_stock_prices(symbol, exchange)
     
     if not price_data:
+        PriceRefreshService.mark_stale(db, symbol, exchange)
+        db.commit()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch price data for {symbol}"
         )
     
-    price = db.query(PriceCache).filter(PriceCache.symbol == symbol).first()
-    
-    if price:
-        price.live_price = price_data["live_price"]
-        price.yesterday_price = price_data["yesterday_price"]
-        price.price_30d_ago = price_data["price_30d_ago"]
-        price.price_1y_ago = price_data["price_1y_ago"]
-        price.last_updated = datetime.now()
-        price.exchange = exchange
-    else:
-        price = PriceCache(
-            symbol=symbol,
-            live_price=price_data["live_price"],
-            yesterday_price=price_data["yesterday_price"],
-            price_30d_ago=price_data["price_30d_ago"],
-            price_1y_ago=price_data["price_1y_ago"],
-            exchange=exchange,
-            last_updated=datetime.now()
-        )
-        db.add(price)
-    
+    price = PriceRefreshService.upsert_price(db, symbol, exchange, price_data)
     db.commit()
     db.refresh(price)
+    background_tasks.add_task(AlertService.evaluate_symbol, symbol)
     return price
 
-def refresh_all_prices_task(db: Session):
-    """Background task to refresh all prices"""
-    holdings = db.query(Holding).all()
-    unique_symbols = {(h.symbol, h.exchange) for h in holdings}
-    
-    for symbol, exchange in unique_symbols:
-        try:
-            price_data = StockPriceService.fetch_stock_prices(symbol, exchange)
-            if price_data:
-                price = db.query(PriceCache).filter(PriceCache.symbol == symbol).first()
-                if price:
-                    price.live_price = price_data["live_price"]
-                    price.yesterday_price = price_data["yesterday_price"]
-                    price.price_30d_ago = price_data["price_30d_ago"]
-                    price.price_1y_ago = price_data["price_1y_ago"]
-                    price.last_updated = datetime.now()
-                else:
-                    price = PriceCache(**price_data, last_updated=datetime.now())
-                    db.add(price)
-        except Exception as e:
-            print(f"Error refreshing {symbol}: {e}")
-            continue
-    
-    db.commit()
-
 @router.post("/refresh-all")
 def refresh_all_prices(background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Refresh prices for all holdings (runs in background)"""
-    background_tasks.add_task(refresh_all_prices_task, db)
-    return {"message": "Price refresh initiated in background"}
\ No newline at end of file
+    """Plan a sharded refresh of all held symbols; shards are processed by workers on every replica"""
+    run, created = PriceRefreshService.plan_run(db)
+    if run.status == "running":
+        # Also for an existing run, so expired leases are reaped and reclaimed
+        # even when no poller is running
+        background_tasks.add_task(PriceRefreshService.run_workers)
+    return {
+        "message": "Price refresh initiated in background" if created else "Price refresh already in progress",
+        "run_id": run.id,
+        "total_shards": run.total_shards,
+        "total_symbols": run.total_symbols
+    }
+
+@router.get("/refresh-all/status")
+def refresh_all_status(run_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Shard progress of a refresh run (latest run by default)"""
+    run_status = PriceRefreshService.run_status(db, run_id)
+    if not run_status:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No price refresh run found"
+        )
+    return run_status
+
+@router.post("/intraday/refresh")
+def refresh_intraday_prices(background_tasks: BackgroundTasks):
+    """Fetch recent intraday bars for all held symbols and update live prices (runs in background)"""
+    background_tasks.add_task(IntradayService.run_collect)
+    return {"message": "Intraday price refresh initiated in background"}
\ No newline at end of file
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi.responses import FileResponse
+from typing import Optional
+import json
+from ..config import settings
+from ..services.profiling_service import ProfilingService
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow access only with the configured admin token; closed when none is set"""
+    if not ProfilingService.is_admin_token(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token required"
+        )
+
+router = APIRouter(prefix="/admin/profiles", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/")
+def list_profiles():
+    """List captured request profiles, newest first"""
+    return {
+        "enabled": settings.PROFILING_ENABLED,
+        "profiles": ProfilingService.list_profiles()
+    }
+
+@router.get("/{profile_id}")
+def get_profile(profile_id: str):
+    """Get a profile's SQL statements, timings and call-stack summary"""
+    path = ProfilingService.get_profile_path(profile_id, ".json")
+    if not path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found"
+        )
+    return json.loads(path.read_text())
+
+@router.get("/{profile_id}/download")
+def download_profile(profile_id: str):
+    """Download the raw cProfile stats (open with pstats or snakeviz)"""
+    path = ProfilingService.get_profile_path(profile_id, ".prof")
+    if not path:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found"
+        )
+    return FileResponse(path, media_type="application/octet-stream", filename=path.name)
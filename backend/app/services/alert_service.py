@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Tuple, Optional
+from decimal import Decimal
+import logging
+import threading
+from ..database import SessionLocal
+from ..models import AlertEvent
+from .price_cache_service import PriceCacheService
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_METRICS = ("day_change_percent", "live_price")
+CLIENT_METRICS = ("day_change_percent", "portfolio_value")
+
+
+class RuleIndex:
+    """
+    Active alert rules compiled into flat arrays.
+    Every rule points at an observation slot ("scope|subject|metric"); matching
+    gathers the observed value for each rule's slot and compares every
+    threshold in one vectorised operation. Only what matching needs is kept;
+    details of fired rules are read back when they are claimed.
+    """
+
+    def __init__(self, rows: list, fingerprint: tuple):
+        self.fingerprint = fingerprint
+        # rows are (id, above, threshold, slot); positional access keeps this cheap at 100k+ rules
+        self.rule_ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.above = np.array([r[1] for r in rows], dtype=bool)
+        self.thresholds = np.array([r[2] for r in rows], dtype=np.float64)
+        codes, keys = pd.factorize(np.array([r[3] for r in rows], dtype=object))
+        self.slots = codes
+        self.keys = pd.Index(keys)
+
+    def __len__(self) -> int:
+        return len(self.rule_ids)
+
+    def match(self, observations: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """Return positions of fired rules and the observed value for each"""
+        values = observations.reindex(self.keys).to_numpy(dtype=np.float64)[self.slots]
+        # Rules without an observation compare against NaN and never fire
+        with np.errstate(invalid="ignore"):
+            fired = np.where(self.above, values >= self.thresholds, values <= self.thresholds)
+        positions = np.flatnonzero(fired)
+        return positions, values[positions]
+
+
+class AlertService:
+    """Evaluates active alert rules in one batch after price writes"""
+
+    _index: Optional[RuleIndex] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _rules_fingerprint(db: Session) -> tuple:
+        row = db.execute(text("""
+            SELECT COUNT(*) AS n, MAX(id) AS max_id, MAX(updated_at) AS max_updated
+            FROM alert_rules
+            WHERE is_active
+        """)).first()
+        return (row.n, row.max_id, row.max_updated)
+
+    @staticmethod
+    def get_rule_index(db: Session) -> RuleIndex:
+        """Compiled rule index, rebuilt only when the active rule set changed"""
+        fingerprint = AlertService._rules_fingerprint(db)
+        with AlertService._lock:
+            index = AlertService._index
+            if index is None or index.fingerprint != fingerprint:
+                rows = db.execute(text("""
+                    SELECT id, direction = 'above' AS above, threshold::float8 AS threshold,
+                           scope || '|' || CASE WHEN scope = 'symbol' THEN symbol ELSE client_id::text END
+                                 || '|' || metric AS slot
+                    FROM alert_rules
+                    WHERE is_active
+                """)).fetchall()
+                index = RuleIndex(rows, fingerprint)
+                AlertService._index = index
+                logger.info(f"Compiled {len(index)} alert rules over {len(index.keys)} observation slots")
+        return index
+
+    @staticmethod
+    def _metric_series(scope: str, subjects: pd.Series, current: pd.Series, previous: pd.Series, value_metric: str) -> pd.Series:
+        """Value and day-change observations keyed by slot"""
+        current = current.astype(float).fillna(0).to_numpy()
+        previous = previous.astype(float).fillna(0).to_numpy()
+        change = np.divide(current - previous, previous, out=np.zeros_like(current), where=previous > 0) * 100
+        prefix = scope + "|" + subjects.astype(str) + "|"
+        return pd.concat([
+            pd.Series(current, index=prefix + value_metric),
+            pd.Series(change, index=prefix + "day_change_percent"),
+        ])
+
+    @staticmethod
+    def get_observations(db: Session, symbol: Optional[str] = None) -> pd.Series:
+        """
+        Current metric values keyed by slot, for every symbol and client book,
+        or only for one symbol and the clients holding it.
+        """
+        prices = pd.DataFrame(
+            PriceCacheService.preferred_prices(db, [symbol] if symbol else None),
+            columns=["symbol", "exchange", "live_price", "yesterday_price"]
+        )
+        totals = pd.DataFrame(db.execute(text(f"""
+            SELECT client_id, current_value, yesterday_value FROM client_portfolio_totals
+            {"WHERE client_id IN (SELECT client_id FROM holdings WHERE symbol = :symbol)" if symbol else ""}
+        """), {"symbol": symbol}).fetchall(), columns=["client_id", "current_value", "yesterday_value"])
+
+        return pd.concat([
+            AlertService._metric_series("symbol", prices.symbol, prices.live_price, prices.yesterday_price, "live_price"),
+            AlertService._metric_series("client", totals.client_id, totals.current_value, totals.yesterday_value, "portfolio_value"),
+        ])
+
+    @staticmethod
+    def evaluate(db: Session, symbol: Optional[str] = None) -> int:
+        """
+        Evaluate active rules against current prices and totals; with a symbol,
+        only the rules that symbol's price can move are considered.
+        A rule fires at most once per day; returns the number of alerts logged.
+        """
+        index = AlertService.get_rule_index(db)
+        if not len(index):
+            return 0
+
+        positions, observed = index.match(AlertService.get_observations(db, symbol))
+        if not len(positions):
+            return 0
+
+        # Claim today's firing atomically so concurrent evaluations don't double-log
+        observed_by_rule = dict(zip(index.rule_ids[positions].tolist(), observed.tolist()))
+        claimed = db.execute(text("""
+            UPDATE alert_rules
+            SET last_triggered_at = NOW()
+            WHERE id = ANY(:ids)
+              AND (last_triggered_at IS NULL OR last_triggered_at::date < CURRENT_DATE)
+            RETURNING id, client_id, symbol, metric, threshold
+        """), {"ids": list(observed_by_rule)}).fetchall()
+
+        events = []
+        for rule in claimed:
+            value = observed_by_rule[rule.id]
+            subject = rule.symbol or f"Client {rule.client_id}"
+            events.append({
+                "rule_id": rule.id,
+                "client_id": rule.client_id,
+                "symbol": rule.symbol,
+                "metric": rule.metric,
+                "observed_value": Decimal(str(round(value, 2))),
+                "threshold": rule.threshold,
+                "message": f"{subject} {rule.metric} is {value:,.2f} (threshold {float(rule.threshold):,.2f})",
+            })
+
+        if events:
+            # Batched into multi-row INSERTs rather than one statement per event
+            db.execute(AlertEvent.__table__.insert(), events)
+        db.commit()
+
+        logger.info(f"Alert evaluation fired {len(events)} alerts")
+        return len(events)
+
+    @staticmethod
+    def evaluate_safely(db: Session, symbol: Optional[str] = None):
+        """Run evaluate() without letting alert failures break a price refresh"""
+        try:
+            AlertService.evaluate(db, symbol)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Alert evaluation failed: {str(e)}")
+
+    @staticmethod
+    def evaluate_symbol(symbol: str):
+        """Background task after a single price write, with its own session"""
+        db = SessionLocal()
+        try:
+            AlertService.evaluate_safely(db, symbol)
+        finally:
+            db.close()
@@ -0,0 +1,124 @@
+from sqlalchemy import text
+from typing import Optional, Dict, Iterator
+from decimal import Decimal
+from datetime import datetime
+import csv
+import io
+import json
+import zlib
+import logging
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [
+    "client_id", "client_name", "holding_id", "symbol", "company_name", "exchange", "quantity",
+    "live_price", "yesterday_price", "price_30d_ago", "price_1y_ago",
+    "current_value", "yesterday_value", "value_30d_ago", "value_1y_ago",
+    "day_change", "day_change_percent", "price_exchange", "price_updated_at",
+]
+
+# Rows fetched per round trip from the server-side cursor
+FETCH_SIZE = 5000
+# Encoded bytes buffered before a chunk is handed to the response
+CHUNK_SIZE = 64 * 1024
+
+class ExportService:
+    """Streams firm-wide holdings out of portfolio_view with flat memory use"""
+
+    @staticmethod
+    def build_query(filters: Dict[str, Optional[object]]):
+        """SELECT over portfolio_view with optional exchange/symbol/client filters"""
+        conditions = []
+        params = {}
+        for column in ("exchange", "symbol", "client_id"):
+            if filters.get(column) is not None:
+                conditions.append(f"v.{column} = :{column}")
+                params[column] = filters[column]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = text(f"""
+            SELECT v.client_id, c.name AS client_name, v.id AS holding_id, v.symbol,
+                   v.company_name, v.exchange, v.quantity,
+                   v.live_price, v.yesterday_price, v.price_30d_ago, v.price_1y_ago,
+                   v.current_value, v.yesterday_value, v.value_30d_ago, v.value_1y_ago,
+                   v.day_change, v.day_change_percent, v.price_exchange, v.price_updated_at
+            FROM portfolio_view v
+            JOIN clients c ON c.id = v.client_id
+            {where}
+            ORDER BY v.client_id, v.symbol
+        """)
+        return query, params
+
+    @staticmethod
+    def _json_value(value):
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _encode_rows(rows: Iterator, fmt: str) -> Iterator[str]:
+        """Encode rows as CSV (with header) or NDJSON, one text fragment per row"""
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for row in rows:
+                writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for row in rows:
+                record = {column: ExportService._json_value(value) for column, value in zip(EXPORT_COLUMNS, row)}
+                yield json.dumps(record) + "\n"
+
+    @staticmethod
+    def stream_holdings(fmt: str = "csv", compress: bool = True, **filters) -> Iterator[bytes]:
+        """
+        Generator of response chunks for every matching holding.
+        Uses its own session and a server-side cursor, so only FETCH_SIZE rows
+        and one CHUNK_SIZE buffer are held in memory at any time.
+        """
+        query, params = ExportService.build_query(filters)
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+        db = SessionLocal()
+        exported = 0
+        try:
+            result = db.execute(
+                query.execution_options(stream_results=True, yield_per=FETCH_SIZE),
+                params
+            )
+
+            def rows():
+                nonlocal exported
+                for row in result:
+                    exported += 1
+                    yield row
+
+            pending = []
+            pending_size = 0
+            for fragment in ExportService._encode_rows(rows(), fmt):
+                data = fragment.encode("utf-8")
+                pending.append(data)
+                pending_size += len(data)
+                if pending_size >= CHUNK_SIZE:
+                    chunk = b"".join(pending)
+                    pending, pending_size = [], 0
+                    if compressor:
+                        chunk = compressor.compress(chunk)
+                    if chunk:
+                        yield chunk
+
+            chunk = b"".join(pending)
+            if compressor:
+                chunk = compressor.compress(chunk) + compressor.flush()
+            if chunk:
+                yield chunk
+
+            logger.info(f"Exported {exported} holdings as {fmt}")
+        finally:
+            db.close()
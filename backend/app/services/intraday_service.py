@@ -0,0 +1,160 @@
+import numpy as np
+from sqlalchemy.orm import Session
+from typing import Optional, Dict, Tuple
+from decimal import Decimal
+from datetime import datetime
+import logging
+import threading
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Holding
+from .stock_service import StockPriceService
+from .portfolio_totals_service import PortfolioTotalsService
+from .price_cache_service import PriceCacheService
+from .alert_service import AlertService
+
+logger = logging.getLogger(__name__)
+
+class BarRingBuffer:
+    """
+    Fixed-capacity ring of intraday bars backed by preallocated numpy arrays.
+    New bars overwrite the oldest ones in place, so memory per symbol is
+    bounded and appending never allocates.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.closes = np.zeros(capacity, dtype=np.float64)
+        self.volumes = np.zeros(capacity, dtype=np.float64)
+        self.head = 0  # next write position
+        self.size = 0
+
+    def last_timestamp(self) -> Optional[int]:
+        if not self.size:
+            return None
+        return int(self.timestamps[(self.head - 1) % self.capacity])
+
+    def latest_close(self) -> Optional[float]:
+        if not self.size:
+            return None
+        return float(self.closes[(self.head - 1) % self.capacity])
+
+    def extend(self, timestamps: np.ndarray, closes: np.ndarray, volumes: np.ndarray) -> int:
+        """Append bars newer than the last stored one; returns how many were written"""
+        last = self.last_timestamp()
+        if last is not None:
+            fresh = timestamps > last
+            timestamps, closes, volumes = timestamps[fresh], closes[fresh], volumes[fresh]
+
+        count = len(timestamps)
+        if count > self.capacity:
+            timestamps, closes, volumes = timestamps[-self.capacity:], closes[-self.capacity:], volumes[-self.capacity:]
+            count = self.capacity
+
+        # At most two slice writes: up to the end of the arrays, then wrapping to the start
+        first = min(count, self.capacity - self.head)
+        for target, source in ((self.timestamps, timestamps), (self.closes, closes), (self.volumes, volumes)):
+            target[self.head:self.head + first] = source[:first]
+            target[:count - first] = source[first:count]
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+        return count
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Copies of the stored bars in chronological order"""
+        order = (self.head - self.size + np.arange(self.size)) % self.capacity
+        return self.timestamps[order], self.closes[order], self.volumes[order]
+
+
+class IntradayService:
+    """Collects recent intraday bars for held listings and keeps live prices current"""
+
+    _buffers: Dict[Tuple[str, str], BarRingBuffer] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_buffer(symbol: str, exchange: str) -> BarRingBuffer:
+        key = (symbol, exchange)
+        buffer = IntradayService._buffers.get(key)
+        if buffer is None:
+            buffer = BarRingBuffer(settings.INTRADAY_BUFFER_SIZE)
+            IntradayService._buffers[key] = buffer
+        return buffer
+
+    @staticmethod
+    def ingest(listings: list) -> Dict[Tuple[str, str], float]:
+        """Fetch bars for the given listings into their buffers; returns latest close per updated listing"""
+        bars = StockPriceService.fetch_intraday_bars(listings, settings.INTRADAY_INTERVAL)
+        updated = {}
+        with IntradayService._lock:
+            for listing, data in bars.items():
+                buffer = IntradayService.get_buffer(*listing)
+                if buffer.extend(data["timestamps"], data["closes"], data["volumes"]):
+                    updated[listing] = buffer.latest_close()
+        return updated
+
+    @staticmethod
+    def collect(db: Session) -> int:
+        """
+        Refresh intraday bars for every held listing and push the latest close
+        into price_cache.live_price. Returns the number of prices updated.
+        """
+        listings = db.query(Holding.symbol, Holding.exchange).distinct().all()
+        updated = IntradayService.ingest([(symbol, exchange) for symbol, exchange in listings])
+
+        count = 0
+        for (symbol, exchange), close in updated.items():
+            before = PortfolioTotalsService.symbol_snapshot(db, symbol)
+            price = PriceCacheService.get_listing(db, symbol, exchange)
+            # Rows are created by the daily refresh, which also fills the historical prices
+            if not price:
+                continue
+            price.live_price = Decimal(str(round(close, 2)))
+            price.last_updated = datetime.now()
+            price.is_stale = False
+            PortfolioTotalsService.on_listing_change(db, symbol, before, price)
+            # Commit per listing so the symbol lock is never held across the batch
+            db.commit()
+            count += 1
+
+        db.commit()
+        logger.info(f"Intraday refresh updated {count} live prices")
+        if count:
+            AlertService.evaluate_safely(db)
+        return count
+
+    @staticmethod
+    def run_collect() -> int:
+        """collect() with its own session, for background tasks outliving the request"""
+        db = SessionLocal()
+        try:
+            return IntradayService.collect(db)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Intraday refresh failed: {str(e)}")
+            return 0
+        finally:
+            db.close()
+
+    @staticmethod
+    def sparkline(symbol: str, exchange: str) -> Dict:
+        """Buffered bars for one listing, fetching them on demand if none are held yet"""
+        with IntradayService._lock:
+            buffer = IntradayService._buffers.get((symbol, exchange))
+            empty = buffer is None or not buffer.size
+        if empty:
+            IntradayService.ingest([(symbol, exchange)])
+
+        with IntradayService._lock:
+            timestamps, closes, volumes = IntradayService.get_buffer(symbol, exchange).snapshot()
+
+        return {
+            "symbol": symbol,
+            "exchange": exchange,
+            "interval": settings.INTRADAY_INTERVAL,
+            "points": [
+                {"timestamp": datetime.fromtimestamp(int(ts)), "close": round(float(close), 2), "volume": int(volume)}
+                for ts, close, volume in zip(timestamps, closes, volumes)
+            ],
+        }
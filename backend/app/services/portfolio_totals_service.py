@@ -0,0 +1,271 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from typing import Optional, Dict
+from types import SimpleNamespace
+from decimal import Decimal
+from datetime import datetime
+from ..models import ClientPortfolioTotals, PriceCache, Holding, HoldingTombstone
+from ..config import settings
+from .price_cache_service import PriceCacheService, EXCHANGES
+
+ZERO = Decimal("0.00")
+
+# price_cache column -> client_portfolio_totals column it contributes to
+VALUE_COLUMNS = {
+    "live_price": "current_value",
+    "yesterday_price": "yesterday_value",
+    "price_30d_ago": "value_30d_ago",
+    "price_1y_ago": "value_1y_ago",
+}
+
+class PortfolioTotalsService:
+    """
+    Keeps client_portfolio_totals in sync with holdings and price_cache.
+    Every write applies only the delta of the position or price that changed,
+    so reading totals never has to touch the holdings table.
+    Each change also bumps the client's version and stamps the touched
+    holdings with it, which is what the delta-sync endpoint reads.
+    """
+
+    @staticmethod
+    def listing_snapshot(price: Optional[PriceCache]) -> Optional[SimpleNamespace]:
+        """Immutable copy of a price_cache row's prices and stale flag"""
+        if price is None:
+            return None
+        return SimpleNamespace(
+            is_stale=bool(price.is_stale),
+            **{column: getattr(price, column) for column in VALUE_COLUMNS}
+        )
+
+    @staticmethod
+    def lock_symbol(db: Session, symbol: str):
+        """
+        Serialise delta maintenance for a symbol until the transaction ends.
+        Without it two writers could both read the same "before" prices and
+        both apply their full delta, leaving totals drifted from price_cache.
+        """
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:symbol))"), {"symbol": symbol})
+
+    @staticmethod
+    def lock_holding(db: Session, holding_id: int) -> Optional[Holding]:
+        """
+        Load a holding for a position change with its symbol locked, re-reading
+        it under the lock so the old quantity can't be changed underneath us.
+        The symbol is taken first (it never changes) to keep the lock order
+        the same as price writers, which lock the symbol and then stamp holdings.
+        """
+        holding = db.query(Holding).filter(Holding.id == holding_id).first()
+        if holding is None:
+            return None
+        PortfolioTotalsService.lock_symbol(db, holding.symbol)
+        return db.query(Holding).filter(Holding.id == holding_id).populate_existing().first()
+
+    @staticmethod
+    def symbol_snapshot(db: Session, symbol: str) -> Dict[str, SimpleNamespace]:
+        """Lock the symbol and snapshot every cached listing of it, keyed by exchange"""
+        PortfolioTotalsService.lock_symbol(db, symbol)
+        return {
+            exchange: PortfolioTotalsService.listing_snapshot(price)
+            for exchange, price in PriceCacheService.get_listings(db, symbol).items()
+        }
+
+    @staticmethod
+    def effective_prices(snapshot: Dict[str, SimpleNamespace], exchange: str) -> Dict[str, Decimal]:
+        """Prices a holding on `exchange` is valued at, with missing prices counted as zero"""
+        chosen = PriceCacheService.pick(snapshot, exchange)
+        return {
+            column: (getattr(chosen, column) if chosen is not None else None) or ZERO
+            for column in VALUE_COLUMNS
+        }
+
+    @staticmethod
+    def get_symbol_prices(db: Session, symbol: str, exchange: str) -> Dict[str, Decimal]:
+        """Effective prices for a holding of symbol on exchange straight from price_cache"""
+        return PortfolioTotalsService.effective_prices(PortfolioTotalsService.symbol_snapshot(db, symbol), exchange)
+
+    @staticmethod
+    def apply_delta(db: Session, client_id: int, price_deltas: Dict[str, Decimal], holdings_delta: int = 0) -> int:
+        """
+        Add value deltas (keyed by price column) and a holding count delta to a client's totals.
+        Returns the client's new change version.
+        """
+        values = {VALUE_COLUMNS[column]: delta for column, delta in price_deltas.items()}
+        stmt = insert(ClientPortfolioTotals).values(
+            client_id=client_id,
+            num_holdings=holdings_delta,
+            version=1,
+            updated_at=datetime.now(),
+            **values
+        )
+        update_set = {
+            column: getattr(ClientPortfolioTotals, column) + getattr(stmt.excluded, column)
+            for column in values
+        }
+        update_set["num_holdings"] = ClientPortfolioTotals.num_holdings + stmt.excluded.num_holdings
+        update_set["version"] = ClientPortfolioTotals.version + 1
+        update_set["updated_at"] = stmt.excluded.updated_at
+        return db.execute(stmt.on_conflict_do_update(
+            index_elements=[ClientPortfolioTotals.client_id],
+            set_=update_set
+        ).returning(ClientPortfolioTotals.version)).scalar()
+
+    @staticmethod
+    def on_position_change(db: Session, holding: Holding, quantity_delta: int, holdings_delta: int = 0):
+        """Apply a change in one holding's quantity (and optionally the holding count) and stamp its version"""
+        prices = PortfolioTotalsService.get_symbol_prices(db, holding.symbol, holding.exchange or "NSE")
+        holding.change_version = PortfolioTotalsService.apply_delta(
+            db,
+            holding.client_id,
+            {column: price * quantity_delta for column, price in prices.items()},
+            holdings_delta
+        )
+        # Write the holding while the symbol lock is held so price writers see it
+        db.flush()
+
+    @staticmethod
+    def on_position_removed(db: Session, holding: Holding):
+        """Remove a holding's contribution and leave a tombstone for delta-sync clients"""
+        PortfolioTotalsService.on_position_change(db, holding, -holding.quantity, holdings_delta=-1)
+        db.add(HoldingTombstone(
+            holding_id=holding.id,
+            client_id=holding.client_id,
+            symbol=holding.symbol,
+            version=holding.change_version
+        ))
+        PortfolioTotalsService.prune_tombstones(db, holding.client_id)
+
+    @staticmethod
+    def prune_tombstones(db: Session, client_id: Optional[int] = None) -> int:
+        """
+        Delete tombstones older than TOMBSTONE_RETENTION_DAYS and raise each
+        affected client's tombstones_pruned_version, so delta-sync callers
+        polling from before it get a full resync. Returns the rows deleted.
+        """
+        return db.execute(text(f"""
+            WITH pruned AS (
+                DELETE FROM holding_tombstones
+                WHERE deleted_at < NOW() - make_interval(days => :days)
+                  {"AND client_id = :client_id" if client_id is not None else ""}
+                RETURNING client_id, version
+            ),
+            horizon AS (
+                SELECT client_id, MAX(version) AS version, COUNT(*) AS deleted
+                FROM pruned
+                GROUP BY client_id
+            ),
+            bumped AS (
+                UPDATE client_portfolio_totals t
+                SET tombstones_pruned_version = GREATEST(t.tombstones_pruned_version, horizon.version)
+                FROM horizon
+                WHERE t.client_id = horizon.client_id
+            )
+            SELECT COALESCE(SUM(deleted), 0) FROM horizon
+        """), {"days": settings.TOMBSTONE_RETENTION_DAYS, "client_id": client_id}).scalar()
+
+    @staticmethod
+    def on_listing_change(db: Session, symbol: str, before: Dict[str, SimpleNamespace], price: PriceCache):
+        """
+        Apply a write to one listing's row, given the symbol snapshot taken
+        (and symbol lock acquired) before the write.
+        """
+        after = {**before, price.exchange: PortfolioTotalsService.listing_snapshot(price)}
+        db.flush()
+        PortfolioTotalsService.on_price_change(db, symbol, before, after)
+
+    @staticmethod
+    def on_price_change(db: Session, symbol: str, before: Dict[str, SimpleNamespace], after: Dict[str, SimpleNamespace]):
+        """
+        Adjust totals of every client holding `symbol` after its cached listings changed,
+        bumping their versions and stamping their affected holdings.
+        A write to one listing can move holdings on both exchanges (through the
+        fallback), so deltas are worked out per exchange. Uses the
+        holdings.symbol index to find affected clients, so the cost is
+        proportional to the number of holders rather than the whole book.
+        """
+        params = {"symbol": symbol}
+        changed = []
+        for exchange in EXCHANGES:
+            old = PortfolioTotalsService.effective_prices(before, exchange)
+            new = PortfolioTotalsService.effective_prices(after, exchange)
+            deltas = {column: new[column] - old[column] for column in VALUE_COLUMNS}
+            params.update({f"{exchange.lower()}_{column}": delta for column, delta in deltas.items()})
+            if any(deltas.values()):
+                changed.append(exchange)
+        if not changed:
+            return
+
+        query = text("""
+            WITH holders AS (
+                SELECT client_id,
+                       SUM(CASE WHEN exchange = 'BSE' THEN 0 ELSE quantity END) AS nse_quantity,
+                       SUM(CASE WHEN exchange = 'BSE' THEN quantity ELSE 0 END) AS bse_quantity
+                FROM holdings
+                WHERE symbol = :symbol AND COALESCE(exchange, 'NSE') = ANY(:exchanges)
+                GROUP BY client_id
+            ),
+            -- Lock the totals rows in client_id order first, so concurrent writers
+            -- of different symbols that share clients can't deadlock on them
+            locked AS (
+                SELECT t.client_id
+                FROM client_portfolio_totals t
+                JOIN holders h ON h.client_id = t.client_id
+                ORDER BY t.client_id
+                FOR UPDATE OF t
+            ),
+            bumped AS (
+                UPDATE client_portfolio_totals t
+                SET current_value = t.current_value
+                        + h.nse_quantity * :nse_live_price + h.bse_quantity * :bse_live_price,
+                    yesterday_value = t.yesterday_value
+                        + h.nse_quantity * :nse_yesterday_price + h.bse_quantity * :bse_yesterday_price,
+                    value_30d_ago = t.value_30d_ago
+                        + h.nse_quantity * :nse_price_30d_ago + h.bse_quantity * :bse_price_30d_ago,
+                    value_1y_ago = t.value_1y_ago
+                        + h.nse_quantity * :nse_price_1y_ago + h.bse_quantity * :bse_price_1y_ago,
+                    version = t.version + 1,
+                    updated_at = NOW()
+                FROM holders h
+                JOIN locked l ON l.client_id = h.client_id
+                WHERE t.client_id = h.client_id
+                RETURNING t.client_id, t.version
+            )
+            UPDATE holdings
+            SET change_version = bumped.version
+            FROM bumped
+            WHERE holdings.client_id = bumped.client_id
+              AND holdings.symbol = :symbol
+              AND COALESCE(holdings.exchange, 'NSE') = ANY(:exchanges)
+        """)
+        db.execute(query, {**params, "exchanges": changed})
+
+    @staticmethod
+    def rebuild(db: Session, client_id: Optional[int] = None):
+        """Recompute totals from portfolio_view, for backfill or to repair drift"""
+        query = text(f"""
+            INSERT INTO client_portfolio_totals (
+                client_id, current_value, yesterday_value, value_30d_ago,
+                value_1y_ago, num_holdings, updated_at
+            )
+            SELECT c.id,
+                   COALESCE(SUM(v.current_value), 0),
+                   COALESCE(SUM(v.yesterday_value), 0),
+                   COALESCE(SUM(v.value_30d_ago), 0),
+                   COALESCE(SUM(v.value_1y_ago), 0),
+                   COUNT(v.id),
+                   NOW()
+            FROM clients c
+            LEFT JOIN portfolio_view v ON v.client_id = c.id
+            {"WHERE c.id = :client_id" if client_id is not None else ""}
+            GROUP BY c.id
+            ORDER BY c.id
+            ON CONFLICT (client_id) DO UPDATE SET
+                current_value = EXCLUDED.current_value,
+                yesterday_value = EXCLUDED.yesterday_value,
+                value_30d_ago = EXCLUDED.value_30d_ago,
+                value_1y_ago = EXCLUDED.value_1y_ago,
+                num_holdings = EXCLUDED.num_holdings,
+                version = client_portfolio_totals.version + 1,
+                updated_at = EXCLUDED.updated_at
+        """)
+        db.execute(query, {"client_id": client_id})
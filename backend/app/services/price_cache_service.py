@@ -0,0 +1,61 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Optional, Dict, List
+from ..models import PriceCache
+
+EXCHANGES = ("NSE", "BSE")
+
+class PriceCacheService:
+    """
+    Price lookups keyed by (symbol, exchange).
+    A holding is valued from its own listing unless that row is missing or
+    stale (its last fetch failed), in which case the other listing's row is
+    used. portfolio_view applies the same rule in SQL.
+    """
+
+    @staticmethod
+    def other_exchange(exchange: str) -> str:
+        return "BSE" if exchange == "NSE" else "NSE"
+
+    @staticmethod
+    def is_usable(price) -> bool:
+        return price is not None and price.live_price is not None and not price.is_stale
+
+    @staticmethod
+    def pick(listings: Dict[str, object], exchange: str):
+        """Row to value a holding on `exchange` with, given the cached rows of its symbol by exchange"""
+        own = listings.get(exchange)
+        other = listings.get(PriceCacheService.other_exchange(exchange))
+        for candidate in (own, other):
+            if PriceCacheService.is_usable(candidate):
+                return candidate
+        return own if own is not None else other
+
+    @staticmethod
+    def get_listing(db: Session, symbol: str, exchange: str) -> Optional[PriceCache]:
+        return db.query(PriceCache).filter(
+            PriceCache.symbol == symbol,
+            PriceCache.exchange == exchange
+        ).first()
+
+    @staticmethod
+    def get_listings(db: Session, symbol: str) -> Dict[str, PriceCache]:
+        return {p.exchange: p for p in db.query(PriceCache).filter(PriceCache.symbol == symbol).all()}
+
+    @staticmethod
+    def resolve(db: Session, symbol: str, exchange: str = "NSE") -> Optional[PriceCache]:
+        """The row a holding of symbol on exchange is valued with (own listing, else fallback)"""
+        return PriceCacheService.pick(PriceCacheService.get_listings(db, symbol), exchange)
+
+    @staticmethod
+    def preferred_prices(db: Session, symbols: Optional[List[str]] = None) -> list:
+        """
+        One row per symbol for symbol-level consumers (alerts, scenarios):
+        a usable listing first, NSE before BSE.
+        """
+        return db.execute(text(f"""
+            SELECT DISTINCT ON (symbol) symbol, exchange, live_price, yesterday_price
+            FROM price_cache
+            {"WHERE symbol = ANY(:symbols)" if symbols is not None else ""}
+            ORDER BY symbol, (live_price IS NOT NULL AND NOT is_stale) DESC, (exchange = 'NSE') DESC
+        """), {"symbols": symbols}).fetchall()
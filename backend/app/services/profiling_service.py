@@ -0,0 +1,168 @@
+from contextvars import ContextVar
+from typing import Optional, List, Dict
+from datetime import datetime
+from pathlib import Path
+import asyncio
+import cProfile
+import functools
+import hmac
+import io
+import json
+import pstats
+import time
+import uuid
+import logging
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Collector for the request currently being profiled; None for every other request.
+# Starlette copies the context into threadpool workers, so sync endpoints and
+# their SQL see the same collector as the middleware.
+current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+class RequestProfile:
+    """Call-stack profile and SQL timings captured for a single request"""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.created_at = datetime.now()
+        self.profiler = cProfile.Profile()
+        self.sql: List[Dict] = []
+
+    def run(self, func, *args, **kwargs):
+        """Run the endpoint function under cProfile in the calling thread"""
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiler already owns this interpreter; keep the SQL timings only
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+
+    def summary(self, limit: int = 40) -> str:
+        stream = io.StringIO()
+        try:
+            stats = pstats.Stats(self.profiler, stream=stream)
+        except TypeError:
+            return "No Python frames were profiled"
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+class ProfilingService:
+    """Per-request profiling hooks and local storage of captured profiles"""
+
+    @staticmethod
+    def is_admin_token(token: Optional[str]) -> bool:
+        """Whether token matches PROFILING_ADMIN_TOKEN; always False while none is configured"""
+        expected = settings.PROFILING_ADMIN_TOKEN
+        if not expected or not token:
+            return False
+        return hmac.compare_digest(token.encode(), expected.encode())
+
+    @staticmethod
+    def profile_dir() -> Path:
+        path = Path(settings.PROFILING_DIR)
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @staticmethod
+    def wrap_endpoint(func):
+        """Wrap a sync endpoint so it runs under the active request profile, if any"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            return profile.run(func, *args, **kwargs)
+        return wrapper
+
+    @staticmethod
+    def install(app, engine):
+        """Instrument API routes and the SQL engine; only called when profiling is enabled"""
+        for route in app.routes:
+            # Async endpoints run on the event loop and are left unprofiled
+            if isinstance(route, APIRoute) and not asyncio.iscoroutinefunction(route.dependant.call):
+                route.dependant.call = ProfilingService.wrap_endpoint(route.dependant.call)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if current_profile.get() is not None:
+                conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            profile = current_profile.get()
+            if profile is None or not conn.info.get("profile_query_start"):
+                return
+            started = conn.info["profile_query_start"].pop()
+            profile.sql.append({
+                "statement": statement,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "executemany": executemany,
+            })
+
+    @staticmethod
+    def save(profile: RequestProfile, status_code: int, duration_ms: float):
+        """Write the profile to PROFILING_DIR and enforce the retention limit"""
+        directory = ProfilingService.profile_dir()
+        try:
+            profile.profiler.dump_stats(str(directory / f"{profile.id}.prof"))
+        except TypeError:
+            pass
+
+        metadata = {
+            "id": profile.id,
+            "method": profile.method,
+            "path": profile.path,
+            "trigger": profile.trigger,
+            "status_code": status_code,
+            "duration_ms": round(duration_ms, 3),
+            "created_at": profile.created_at.isoformat(),
+            "sql_count": len(profile.sql),
+            "sql_total_ms": round(sum(q["duration_ms"] for q in profile.sql), 3),
+            "sql": profile.sql,
+            "summary": profile.summary(),
+        }
+        (directory / f"{profile.id}.json").write_text(json.dumps(metadata))
+        logger.info(f"Saved profile {profile.id} for {profile.method} {profile.path} ({duration_ms:.1f} ms)")
+
+        ProfilingService.enforce_retention()
+
+    @staticmethod
+    def enforce_retention():
+        """Delete the oldest profiles beyond PROFILING_MAX_PROFILES"""
+        profiles = sorted(ProfilingService.profile_dir().glob("*.json"))
+        for stale in profiles[:max(len(profiles) - settings.PROFILING_MAX_PROFILES, 0)]:
+            stale.unlink(missing_ok=True)
+            stale.with_suffix(".prof").unlink(missing_ok=True)
+
+    @staticmethod
+    def list_profiles() -> List[Dict]:
+        """Metadata of stored profiles, newest first (without SQL and summary)"""
+        results = []
+        for path in sorted(ProfilingService.profile_dir().glob("*.json"), reverse=True):
+            try:
+                metadata = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            metadata.pop("sql", None)
+            metadata.pop("summary", None)
+            results.append(metadata)
+        return results
+
+    @staticmethod
+    def get_profile_path(profile_id: str, suffix: str) -> Optional[Path]:
+        """Path of a stored profile file, or None if unknown (ids are validated against the listing)"""
+        for path in ProfilingService.profile_dir().glob(f"*{suffix}"):
+            if path.stem == profile_id:
+                return path
+        return None
@@ -0,0 +1,320 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Optional, Dict, List, Tuple
+from datetime import datetime
+import logging
+import os
+import socket
+import threading
+from ..config import settings
+from ..database import SessionLocal
+from ..models import Holding, PriceCache, PriceRefreshRun, PriceRefreshShard
+from .stock_service import StockPriceService
+from .portfolio_totals_service import PortfolioTotalsService
+from .price_cache_service import PriceCacheService
+from .alert_service import AlertService
+
+logger = logging.getLogger(__name__)
+
+# Serialises run planning across every replica (pg_advisory_xact_lock key)
+PLAN_LOCK_KEY = 73012024
+
+class PriceRefreshService:
+    """
+    Splits a full price refresh into symbol shards stored in price_refresh_shards.
+    Any worker on any replica claims a shard by taking a time-limited lease;
+    a shard whose lease expires (crashed worker) is claimed again.
+    """
+
+    @staticmethod
+    def worker_id() -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    @staticmethod
+    def upsert_price(db: Session, symbol: str, exchange: str, price_data: Dict) -> PriceCache:
+        """Write fetched prices into the listing's price_cache row and apply the delta to client totals"""
+        before = PortfolioTotalsService.symbol_snapshot(db, symbol)
+        price = PriceCacheService.get_listing(db, symbol, exchange)
+
+        if price:
+            price.live_price = price_data["live_price"]
+            price.yesterday_price = price_data["yesterday_price"]
+            price.price_30d_ago = price_data["price_30d_ago"]
+            price.price_1y_ago = price_data["price_1y_ago"]
+            price.last_updated = datetime.now()
+            price.is_stale = False
+        else:
+            price = PriceCache(
+                symbol=symbol,
+                live_price=price_data["live_price"],
+                yesterday_price=price_data["yesterday_price"],
+                price_30d_ago=price_data["price_30d_ago"],
+                price_1y_ago=price_data["price_1y_ago"],
+                exchange=exchange,
+                is_stale=False,
+                last_updated=datetime.now()
+            )
+            db.add(price)
+
+        PortfolioTotalsService.on_listing_change(db, symbol, before, price)
+        return price
+
+    @staticmethod
+    def mark_stale(db: Session, symbol: str, exchange: str):
+        """
+        Flag a listing whose fetch failed, so holdings on it fall back to the
+        symbol's other listing until a fetch succeeds again.
+        """
+        before = PortfolioTotalsService.symbol_snapshot(db, symbol)
+        price = PriceCacheService.get_listing(db, symbol, exchange)
+        if price is None or price.is_stale:
+            return
+        price.is_stale = True
+        PortfolioTotalsService.on_listing_change(db, symbol, before, price)
+
+    @staticmethod
+    def get_active_run(db: Session) -> Optional[PriceRefreshRun]:
+        return db.query(PriceRefreshRun).filter(PriceRefreshRun.status == "running").order_by(PriceRefreshRun.id.desc()).first()
+
+    @staticmethod
+    def plan_run(db: Session) -> Tuple[PriceRefreshRun, bool]:
+        """
+        Create a run with one shard per PRICE_REFRESH_SHARD_SIZE listings.
+        Returns (run, created); an already active run is returned instead of
+        planning a second one, so concurrent calls never refresh twice.
+        """
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PLAN_LOCK_KEY})
+
+        active = PriceRefreshService.get_active_run(db)
+        if active:
+            db.commit()
+            return active, False
+
+        listings = sorted({(h.symbol, h.exchange) for h in db.query(Holding.symbol, Holding.exchange).distinct()})
+        size = settings.PRICE_REFRESH_SHARD_SIZE
+        chunks = [listings[i:i + size] for i in range(0, len(listings), size)]
+
+        run = PriceRefreshRun(
+            status="running" if chunks else "done",
+            total_shards=len(chunks),
+            total_symbols=len(listings),
+            finished_at=None if chunks else datetime.now()
+        )
+        db.add(run)
+        db.flush()
+        db.add_all([
+            PriceRefreshShard(run_id=run.id, shard_no=i, listings=[list(l) for l in chunk])
+            for i, chunk in enumerate(chunks)
+        ])
+        db.commit()
+        db.refresh(run)
+        logger.info(f"Planned price refresh run {run.id}: {len(listings)} listings in {len(chunks)} shards")
+        return run, True
+
+    @staticmethod
+    def reap_expired(db: Session):
+        """Fail shards whose lease expired on their last allowed attempt"""
+        db.execute(text("""
+            UPDATE price_refresh_shards
+            SET status = 'failed', error = 'Lease expired after max attempts', finished_at = NOW()
+            WHERE status = 'running' AND lease_expires_at < NOW() AND attempts >= :max_attempts
+        """), {"max_attempts": settings.PRICE_REFRESH_MAX_ATTEMPTS})
+        db.commit()
+
+    @staticmethod
+    def claim_shard(db: Session, owner: str) -> Optional[Dict]:
+        """Lease the next pending (or expired) shard; SKIP LOCKED keeps workers from contending"""
+        row = db.execute(text("""
+            UPDATE price_refresh_shards
+            SET status = 'running',
+                lease_owner = :owner,
+                lease_expires_at = NOW() + make_interval(secs => :lease),
+                attempts = attempts + 1,
+                processed = 0,
+                failed = 0,
+                started_at = NOW()
+            WHERE id = (
+                SELECT id FROM price_refresh_shards
+                WHERE (status = 'pending' OR (status = 'running' AND lease_expires_at < NOW()))
+                  AND attempts < :max_attempts
+                ORDER BY run_id, shard_no
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, run_id, shard_no, listings
+        """), {
+            "owner": owner,
+            "lease": settings.PRICE_REFRESH_LEASE_SECONDS,
+            "max_attempts": settings.PRICE_REFRESH_MAX_ATTEMPTS,
+        }).first()
+        db.commit()
+        return dict(row._mapping) if row else None
+
+    @staticmethod
+    def renew_lease(db: Session, shard_id: int, owner: str, processed: int, failed: int) -> bool:
+        """Extend our lease and record progress; False means another worker took the shard over"""
+        result = db.execute(text("""
+            UPDATE price_refresh_shards
+            SET lease_expires_at = NOW() + make_interval(secs => :lease),
+                processed = :processed,
+                failed = :failed
+            WHERE id = :shard_id AND lease_owner = :owner AND status = 'running'
+        """), {
+            "lease": settings.PRICE_REFRESH_LEASE_SECONDS,
+            "processed": processed,
+            "failed": failed,
+            "shard_id": shard_id,
+            "owner": owner,
+        })
+        return result.rowcount == 1
+
+    @staticmethod
+    def process_shard(db: Session, shard: Dict, owner: str):
+        """Refresh every listing in a leased shard, committing progress with each lease renewal"""
+        processed = failed = 0
+        for symbol, exchange in shard["listings"]:
+            try:
+                price_data = StockPriceService.fetch_stock_prices(symbol, exchange)
+                if price_data:
+                    PriceRefreshService.upsert_price(db, symbol, exchange, price_data)
+                else:
+                    PriceRefreshService.mark_stale(db, symbol, exchange)
+                    failed += 1
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error refreshing {symbol}: {e}")
+                failed += 1
+            processed += 1
+
+            if not PriceRefreshService.renew_lease(db, shard["id"], owner, processed, failed):
+                db.rollback()
+                logger.warning(f"Lost lease on shard {shard['id']}; leaving it to the new owner")
+                return
+            db.commit()
+
+        db.execute(text("""
+            UPDATE price_refresh_shards
+            SET status = 'done', finished_at = NOW(), lease_expires_at = NULL
+            WHERE id = :shard_id AND lease_owner = :owner
+        """), {"shard_id": shard["id"], "owner": owner})
+        db.commit()
+
+    @staticmethod
+    def finish_runs(db: Session) -> List[int]:
+        """
+        Close runs with no outstanding shards: 'done' if every shard succeeded,
+        'failed' if any shard gave up. Returns the ids this call closed.
+        """
+        closed = db.execute(text("""
+            UPDATE price_refresh_runs r
+            SET status = CASE WHEN EXISTS (
+                    SELECT 1 FROM price_refresh_shards s
+                    WHERE s.run_id = r.id AND s.status = 'failed'
+                ) THEN 'failed' ELSE 'done' END,
+                finished_at = NOW()
+            WHERE r.status = 'running'
+              AND NOT EXISTS (
+                  SELECT 1 FROM price_refresh_shards s
+                  WHERE s.run_id = r.id AND s.status IN ('pending', 'running')
+              )
+            RETURNING r.id
+        """)).scalars().all()
+        db.commit()
+        return closed
+
+    @staticmethod
+    def run_worker() -> int:
+        """Claim and process shards until none are left; returns the number processed"""
+        owner = PriceRefreshService.worker_id()
+        db = SessionLocal()
+        count = 0
+        try:
+            while True:
+                try:
+                    PriceRefreshService.reap_expired(db)
+                    shard = PriceRefreshService.claim_shard(db, owner)
+                    if not shard:
+                        break
+                    PriceRefreshService.process_shard(db, shard, owner)
+                    count += 1
+                except Exception as e:
+                    # A shard we held is reclaimed once its lease expires
+                    db.rollback()
+                    logger.error(f"Price refresh worker {owner} stopped: {str(e)}")
+                    break
+
+            # Whoever closes a run evaluates alerts once against the fresh prices
+            try:
+                if PriceRefreshService.finish_runs(db):
+                    AlertService.evaluate_safely(db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error closing price refresh runs: {str(e)}")
+        finally:
+            db.close()
+        return count
+
+    @staticmethod
+    def run_workers(workers: Optional[int] = None):
+        """Process shards with several threads in this process"""
+        threads = [
+            threading.Thread(target=PriceRefreshService.run_worker, daemon=True)
+            for _ in range(workers or settings.PRICE_REFRESH_WORKERS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    @staticmethod
+    def start_poller(stop: threading.Event) -> threading.Thread:
+        """Background loop that lets this replica pick up shards planned by any other one"""
+        def poll():
+            while not stop.wait(settings.PRICE_REFRESH_POLL_SECONDS):
+                try:
+                    PriceRefreshService.run_workers()
+                except Exception as e:
+                    logger.error(f"Price refresh poller error: {str(e)}")
+
+        thread = threading.Thread(target=poll, name="price-refresh-poller", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def run_status(db: Session, run_id: Optional[int] = None) -> Optional[Dict]:
+        """Progress of a run (latest if no id) with per-shard detail"""
+        query = db.query(PriceRefreshRun)
+        run = query.filter(PriceRefreshRun.id == run_id).first() if run_id else query.order_by(PriceRefreshRun.id.desc()).first()
+        if not run:
+            return None
+
+        shards = db.query(PriceRefreshShard).filter(PriceRefreshShard.run_id == run.id).order_by(PriceRefreshShard.shard_no).all()
+        counts = {status: 0 for status in ("pending", "running", "done", "failed")}
+        for shard in shards:
+            counts[shard.status] += 1
+
+        return {
+            "run_id": run.id,
+            "status": run.status,
+            "created_at": run.created_at,
+            "finished_at": run.finished_at,
+            "total_symbols": run.total_symbols,
+            "symbols_processed": sum(s.processed for s in shards),
+            "symbols_failed": sum(s.failed for s in shards),
+            "total_shards": run.total_shards,
+            "shards_by_status": counts,
+            "shards": [
+                {
+                    "shard_no": s.shard_no,
+                    "status": s.status,
+                    "symbols": len(s.listings),
+                    "processed": s.processed,
+                    "failed": s.failed,
+                    "attempts": s.attempts,
+                    "lease_owner": s.lease_owner,
+                    "lease_expires_at": s.lease_expires_at,
+                    "error": s.error,
+                }
+                for s in shards
+            ],
+        }
@@ -0,0 +1,238 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Optional, Dict, List, Tuple
+from datetime import datetime, date
+from statistics import NormalDist
+import logging
+import threading
+import time
+from .stock_service import StockPriceService
+
+logger = logging.getLogger(__name__)
+
+# Listings need this many daily returns to enter the covariance matrix
+MIN_OBSERVATIONS = 60
+CONFIDENCE_LEVELS = (0.95, 0.99)
+# Wait this long after a failed model build before downloading again
+BUILD_RETRY_SECONDS = 300
+
+class RiskModel:
+    """Shared daily-returns matrix and covariance for every held listing"""
+
+    def __init__(self, listings: List[Tuple[str, str]], returns: np.ndarray, key: tuple):
+        self.key = key
+        self.computed_at = datetime.now()
+        self.listings = listings
+        self.position = {listing: i for i, listing in enumerate(listings)}
+        self.returns = returns  # T x N daily returns
+        self.covariance = np.atleast_2d(np.cov(returns, rowvar=False)) if len(listings) else np.zeros((0, 0))
+        std = np.sqrt(np.diag(self.covariance))
+        denominator = np.outer(std, std)
+        self.correlation = np.divide(
+            self.covariance, denominator,
+            out=np.zeros_like(self.covariance), where=denominator > 0
+        )
+
+    def top_pairs(self, indices: np.ndarray, limit: int) -> List[Dict]:
+        """Most correlated pairs among the given listing positions"""
+        if len(indices) < 2 or limit <= 0:
+            return []
+        sub = self.correlation[np.ix_(indices, indices)]
+        rows, cols = np.triu_indices(len(indices), 1)
+        values = sub[rows, cols]
+        order = np.argsort(values)[::-1][:limit]
+        return [
+            {
+                "symbol_a": self.listings[indices[rows[i]]][0],
+                "symbol_b": self.listings[indices[cols[i]]][0],
+                "correlation": round(float(values[i]), 4),
+            }
+            for i in order
+        ]
+
+
+class RiskService:
+    """
+    Firm-wide risk numbers from one covariance matrix.
+    The model is rebuilt at most once per day, or after a price refresh run
+    completes; per-client figures are quadratic forms against value vectors.
+    """
+
+    _model: Optional[RiskModel] = None
+    _retry_after = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _model_key(db: Session) -> tuple:
+        latest_run = db.execute(text("""
+            SELECT MAX(id) FROM price_refresh_runs WHERE status IN ('done', 'failed')
+        """)).scalar()
+        return (date.today(), latest_run)
+
+    @staticmethod
+    def build_model(db: Session, key: tuple) -> Optional[RiskModel]:
+        """
+        Fetch one year of closes for all held listings and compute daily returns.
+        Returns None when listings are held but no history could be downloaded.
+        """
+        listings = [tuple(row) for row in db.execute(text("""
+            SELECT DISTINCT symbol, exchange FROM holdings ORDER BY symbol, exchange
+        """)).fetchall()]
+        if not listings:
+            return RiskModel([], np.zeros((0, 0)), key)
+        history = StockPriceService.fetch_close_history(listings, period="1y")
+        if not history:
+            return None
+
+        covered = list(history)
+        closes = pd.concat([history[listing] for listing in covered], axis=1, keys=range(len(covered)))
+        returns = closes.sort_index().ffill().pct_change().iloc[1:]
+        enough = returns.notna().sum().to_numpy() >= MIN_OBSERVATIONS
+        returns = returns.loc[:, enough].fillna(0.0)
+
+        model = RiskModel([covered[i] for i in np.flatnonzero(enough)], returns.to_numpy(), key)
+        logger.info(f"Built risk model: {len(model.listings)} listings x {len(returns)} days")
+        return model
+
+    @staticmethod
+    def get_model(db: Session) -> RiskModel:
+        """
+        Current model, rebuilding it when its key moved on. Only one thread
+        builds at a time; while it does, other callers keep getting the
+        previous model instead of waiting on the download. A failed build is
+        never cached: the previous model stays in use and the build is
+        retried after BUILD_RETRY_SECONDS.
+        """
+        key = RiskService._model_key(db)
+        model = RiskService._model
+        if model is not None and (model.key == key or time.monotonic() < RiskService._retry_after):
+            return model
+
+        if not RiskService._lock.acquire(blocking=model is None):
+            return model
+        try:
+            model = RiskService._model
+            if model is not None and (model.key == key or time.monotonic() < RiskService._retry_after):
+                return model
+            try:
+                built = RiskService.build_model(db, key)
+            except Exception as e:
+                logger.error(f"Risk model build failed: {str(e)}")
+                built = None
+            if built is not None:
+                RiskService._model = built
+                return built
+
+            RiskService._retry_after = time.monotonic() + BUILD_RETRY_SECONDS
+            logger.warning("No price history for the risk model; keeping the previous model")
+            # Nothing to fall back on: an uncached empty model, rebuilt on the next call
+            return model if model is not None else RiskModel([], np.zeros((0, 0)), None)
+        finally:
+            RiskService._lock.release()
+
+    @staticmethod
+    def load_positions(db: Session, model: RiskModel, client_id: Optional[int] = None):
+        """
+        Value matrix (clients x listings) at live prices.
+        Returns client rows, the matrix, total value and value not covered by the model.
+        """
+        rows = db.execute(text(f"""
+            SELECT c.id AS client_id, c.name AS client_name, v.symbol, v.exchange,
+                   COALESCE(v.current_value, 0) AS value
+            FROM clients c
+            JOIN portfolio_view v ON v.client_id = c.id
+            {"WHERE c.id = :client_id" if client_id is not None else ""}
+            ORDER BY c.id
+        """), {"client_id": client_id}).fetchall()
+
+        clients = {}
+        for row in rows:
+            clients.setdefault(row.client_id, row.client_name)
+        client_index = {cid: i for i, cid in enumerate(clients)}
+
+        values = np.zeros((len(clients), len(model.listings)))
+        total = np.zeros(len(clients))
+        for row in rows:
+            i = client_index[row.client_id]
+            value = float(row.value or 0)
+            total[i] += value
+            j = model.position.get((row.symbol, row.exchange))
+            if j is not None:
+                values[i, j] += value
+
+        return list(clients.items()), values, total, total - values.sum(axis=1)
+
+    @staticmethod
+    def compute(model: RiskModel, values: np.ndarray, horizon_days: int = 1) -> Dict[str, np.ndarray]:
+        """Volatility and VaR for every row of the value matrix at once"""
+        scale = np.sqrt(horizon_days)
+        # Row-wise quadratic form v·Σ·v as one matmul (einsum would loop clients x N^2)
+        variance = ((values @ model.covariance) * values).sum(axis=1) if values.size else np.zeros(len(values))
+        volatility = np.sqrt(np.maximum(variance, 0))
+        # Daily P&L of every client under every historical day: T x clients
+        pnl = model.returns @ values.T if values.size else np.zeros((0, len(values)))
+
+        metrics = {"daily_volatility": volatility}
+        for level in CONFIDENCE_LEVELS:
+            pct = int(level * 100)
+            metrics[f"parametric_var_{pct}"] = NormalDist().inv_cdf(level) * volatility * scale
+            if len(pnl):
+                metrics[f"historical_var_{pct}"] = np.maximum(-np.percentile(pnl, (1 - level) * 100, axis=0), 0) * scale
+            else:
+                metrics[f"historical_var_{pct}"] = np.zeros(len(values))
+        return metrics
+
+    @staticmethod
+    def client_report(
+        db: Session,
+        client_id: Optional[int] = None,
+        horizon_days: int = 1,
+        top_pairs: int = 5
+    ) -> Dict:
+        """Per-client risk plus firm-wide aggregate"""
+        model = RiskService.get_model(db)
+        clients, values, total, uncovered = RiskService.load_positions(db, model, client_id)
+        metrics = RiskService.compute(model, values, horizon_days)
+
+        results = []
+        for i, (cid, name) in enumerate(clients):
+            value = float(total[i])
+            volatility = float(metrics["daily_volatility"][i])
+            held = np.flatnonzero(values[i])
+            results.append({
+                "client_id": cid,
+                "client_name": name,
+                "portfolio_value": round(value, 2),
+                "uncovered_value": round(float(uncovered[i]), 2),
+                "daily_volatility": round(volatility, 2),
+                "daily_volatility_percent": round(volatility / value * 100, 4) if value else 0.0,
+                "annual_volatility_percent": round(volatility / value * 100 * np.sqrt(252), 4) if value else 0.0,
+                "var": {
+                    metric: round(float(series[i]), 2)
+                    for metric, series in metrics.items() if metric != "daily_volatility"
+                },
+                "top_correlated_pairs": model.top_pairs(held, top_pairs),
+            })
+
+        firm_values = values.sum(axis=0, keepdims=True)
+        firm_metrics = RiskService.compute(model, firm_values, horizon_days)
+        firm_value = float(total.sum())
+        return {
+            "horizon_days": horizon_days,
+            "model_computed_at": model.computed_at,
+            "symbols_in_model": len(model.listings),
+            "observations": len(model.returns),
+            "firm": {
+                "portfolio_value": round(firm_value, 2),
+                "uncovered_value": round(float(uncovered.sum()), 2),
+                "daily_volatility": round(float(firm_metrics["daily_volatility"][0]), 2),
+                "var": {
+                    metric: round(float(series[0]), 2)
+                    for metric, series in firm_metrics.items() if metric != "daily_volatility"
+                },
+                "top_correlated_pairs": model.top_pairs(np.flatnonzero(firm_values[0]), top_pairs),
+            },
+            "clients": results,
+        }
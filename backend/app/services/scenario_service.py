@@ -0,0 +1,184 @@
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional
+from ..models.schemas import ScenarioRequest
+from .price_cache_service import PriceCacheService
+
+class ScenarioError(ValueError):
+    """Scenario input that cannot be evaluated (unknown symbols, bad weights)"""
+
+class ScenarioService:
+    """
+    What-if price shocks and rebalancing evaluated as matrix operations.
+    Positions form a clients x symbols value matrix and every scenario a row
+    of price multipliers, so all books are valued under all scenarios at once.
+    """
+
+    @staticmethod
+    def load_positions(db: Session, client_ids: Optional[List[int]] = None):
+        """
+        Holding rows for the selected clients from portfolio_view, so each
+        holding is valued from its own listing, with client names and the held symbols
+        """
+        rows = db.execute(text(f"""
+            SELECT v.client_id, c.name AS client_name, v.symbol, v.quantity, v.live_price, v.current_value
+            FROM portfolio_view v
+            JOIN clients c ON c.id = v.client_id
+            {"WHERE v.client_id = ANY(:client_ids)" if client_ids else ""}
+            ORDER BY v.client_id
+        """), {"client_ids": client_ids}).fetchall()
+
+        clients = {}
+        for row in rows:
+            clients.setdefault(row.client_id, row.client_name)
+        symbols = sorted({row.symbol for row in rows})
+        return clients, symbols, rows
+
+    @staticmethod
+    def load_prices(db: Session, symbols: List[str]) -> Dict[str, float]:
+        """Symbol-level prices, for buying symbols a book does not hold yet"""
+        rows = PriceCacheService.preferred_prices(db, symbols)
+        return {row.symbol: float(row.live_price) for row in rows if row.live_price is not None}
+
+    @staticmethod
+    def simulate(db: Session, request: ScenarioRequest) -> Dict:
+        """Value every selected book under every scenario; rebalance scenarios also get trades"""
+        for spec in request.scenarios:
+            weights = spec.target_weights or {}
+            if any(weight < 0 for weight in weights.values()):
+                raise ScenarioError(f"{spec.name}: target weights must not be negative")
+            if sum(weights.values()) > 1.0001:
+                raise ScenarioError(f"{spec.name}: target weights must sum to at most 1 (the remainder is held as cash)")
+
+        clients, held_symbols, rows = ScenarioService.load_positions(db, request.client_ids)
+
+        target_symbols = {s for spec in request.scenarios for s in (spec.target_weights or {})}
+        shock_symbols = {s for spec in request.scenarios for s in spec.shocks}
+        symbols = sorted(set(held_symbols) | target_symbols)
+        prices = ScenarioService.load_prices(db, sorted(target_symbols | shock_symbols))
+
+        # Holdings without a price on any listing: valued at zero and never traded
+        unpriced = sorted({r.symbol for r in rows if r.live_price is None})
+        priced_rows = [r for r in rows if r.live_price is not None]
+
+        missing = sorted(target_symbols - set(prices))
+        if missing:
+            raise ScenarioError(f"No cached price for target symbols: {', '.join(missing)}")
+        unknown = sorted(shock_symbols - set(held_symbols) - set(prices))
+        if unknown:
+            raise ScenarioError(f"Unknown symbols in shocks: {', '.join(unknown)}")
+
+        column = {symbol: j for j, symbol in enumerate(symbols)}
+        client_index = {cid: i for i, cid in enumerate(clients)}
+
+        quantities = np.zeros((len(clients), len(symbols)))
+        values = np.zeros((len(clients), len(symbols)))
+        if priced_rows:
+            cells = (
+                np.array([client_index[r.client_id] for r in priced_rows]),
+                np.array([column[r.symbol] for r in priced_rows]),
+            )
+            np.add.at(quantities, cells, np.array([r.quantity for r in priced_rows], dtype=np.float64))
+            np.add.at(values, cells, np.array([r.current_value for r in priced_rows], dtype=np.float64))
+        # Buy price for symbols a book does not hold; held ones trade at the book's own price
+        symbol_prices = np.array([prices.get(symbol, 0.0) for symbol in symbols])
+
+        # Scenario x symbol price multipliers
+        multipliers = np.empty((len(request.scenarios), len(symbols)))
+        for s, spec in enumerate(request.scenarios):
+            multipliers[s] = 1 + spec.market_shock_percent / 100
+            for symbol, change in spec.shocks.items():
+                if symbol in column:
+                    multipliers[s, column[symbol]] = 1 + change / 100
+        multipliers = np.maximum(multipliers, 0)
+
+        value_before = values.sum(axis=1)                       # clients
+        value_after = values @ multipliers.T                    # clients x scenarios
+        pnl = value_after - value_before[:, None]
+        pnl_percent = np.divide(
+            pnl * 100, value_before[:, None],
+            out=np.zeros_like(pnl), where=value_before[:, None] > 0
+        )
+
+        # Scenario -> symbol weight vector; trades are built per book while emitting it
+        weights = {}
+        if request.include_trades:
+            for s, spec in enumerate(request.scenarios):
+                if spec.target_weights:
+                    weights[s] = np.zeros(len(symbols))
+                    for symbol, weight in spec.target_weights.items():
+                        weights[s][column[symbol]] = weight
+
+        client_results = []
+        for cid, i in client_index.items():
+            outcomes = []
+            for s, spec in enumerate(request.scenarios):
+                outcome = {
+                    "name": spec.name,
+                    "value_after": round(float(value_after[i, s]), 2),
+                    "pnl": round(float(pnl[i, s]), 2),
+                    "pnl_percent": round(float(pnl_percent[i, s]), 2),
+                }
+                if s in weights:
+                    book_prices = np.divide(
+                        values[i], quantities[i], out=symbol_prices.copy(), where=quantities[i] > 0
+                    ) * multipliers[s]
+                    trades = ScenarioService.rebalance_trades(
+                        weights[s], quantities[i], book_prices, value_after[i, s]
+                    )
+                    outcome["trades"] = ScenarioService.trade_list(trades, symbols, book_prices)
+                outcomes.append(outcome)
+            client_results.append({
+                "client_id": cid,
+                "client_name": clients[cid],
+                "value_before": round(float(value_before[i]), 2),
+                "scenarios": outcomes,
+            })
+
+        total_before = float(value_before.sum())
+        return {
+            "total_clients": len(clients),
+            "total_value_before": round(total_before, 2),
+            "unpriced_symbols": unpriced,
+            "scenarios": [
+                {
+                    "name": spec.name,
+                    "total_value_after": round(float(value_after[:, s].sum()), 2),
+                    "total_pnl": round(float(pnl[:, s].sum()), 2),
+                    "total_pnl_percent": round(float(pnl[:, s].sum()) / total_before * 100, 2) if total_before else 0.0,
+                }
+                for s, spec in enumerate(request.scenarios)
+            ],
+            "clients": client_results,
+        }
+
+    @staticmethod
+    def rebalance_trades(
+        weights: np.ndarray,
+        quantities: np.ndarray,
+        prices: np.ndarray,
+        book_value: float
+    ) -> np.ndarray:
+        """
+        Whole-share trades (per symbol) that move one book to the target weights.
+        Symbols without a price are left untouched rather than sold for nothing.
+        """
+        priced = prices > 0
+        target_quantities = np.floor(np.divide(
+            book_value * weights, prices,
+            out=np.zeros_like(weights), where=priced
+        ))
+        return np.where(priced, target_quantities - quantities, 0)
+
+    @staticmethod
+    def trade_list(trades: np.ndarray, symbols: List[str], prices: np.ndarray) -> List[Dict]:
+        return [
+            {
+                "symbol": symbols[j],
+                "action": "BUY" if trades[j] > 0 else "SELL",
+                "quantity": int(abs(trades[j])),
+                "value": round(float(abs(trades[j]) * prices[j]), 2),
+            }
+            for j in np.flatnonzero(trades)
+        ]
@@ -1,5 +1,7 @@
 import yfinance as yf
-from typing import Optional, Dict
+import numpy as np
+import pandas as pd
+from typing import Optional, Dict, List, Tuple
 from decimal import Decimal
 import logging
 
@@ -68,4 +70,97 @@ class StockPriceService:
             price_data = StockPriceService.fetch_stock_prices(symbol, exchange)
             if price_data:
                 results[symbol] = price_data
+        return results
+    
+    @staticmethod
+    def fetch_intraday_bars(listings: List[Tuple[str, str]], interval: str = "5m") -> Dict[Tuple[str, str], Dict]:
+        """
+        Fetch today's intraday bars for many (symbol, exchange) listings in one request
+        Returns {(symbol, exchange): {"timestamps", "closes", "volumes"}} as numpy arrays
+        """
+        if not listings:
+            return {}
+        
+        yahoo_symbols = {
+            StockPriceService.get_yahoo_symbol(symbol, exchange): (symbol, exchange)
+            for symbol, exchange in listings
+        }
+        
+        try:
+            data = yf.download(
+                list(yahoo_symbols),
+                period="1d",
+                interval=interval,
+                group_by="ticker",
+                auto_adjust=False,
+                progress=False
+            )
+        except Exception as e:
+            logger.error(f"Intraday fetch failed: {str(e)}")
+            return {}
+        
+        results = {}
+        for yahoo_symbol, listing in yahoo_symbols.items():
+            if isinstance(data.columns, pd.MultiIndex):
+                if yahoo_symbol not in data.columns.get_level_values(0):
+                    continue
+                bars = data[yahoo_symbol]
+            else:
+                bars = data
+            
+            bars = bars.dropna(subset=["Close"])
+            if bars.empty:
+                logger.warning(f"No intraday data for {yahoo_symbol}")
+                continue
+            
+            results[listing] = {
+                "timestamps": np.array([int(ts.timestamp()) for ts in bars.index], dtype=np.int64),
+                "closes": bars["Close"].to_numpy(dtype=np.float64),
+                "volumes": bars["Volume"].fillna(0).to_numpy(dtype=np.float64),
+            }
+        return results
+    
+    @staticmethod
+    def fetch_close_history(listings: List[Tuple[str, str]], period: str = "1y") -> Dict[Tuple[str, str], pd.Series]:
+        """
+        Fetch daily closing prices for many (symbol, exchange) listings in one request
+        Returns {(symbol, exchange): Series of closes indexed by date}
+        """
+        if not listings:
+            return {}
+        
+        yahoo_symbols = {
+            StockPriceService.get_yahoo_symbol(symbol, exchange): (symbol, exchange)
+            for symbol, exchange in listings
+        }
+        
+        try:
+            data = yf.download(
+                list(yahoo_symbols),
+                period=period,
+                interval="1d",
+                group_by="ticker",
+                auto_adjust=False,
+                progress=False
+            )
+        except Exception as e:
+            logger.error(f"History fetch failed: {str(e)}")
+            return {}
+        
+        results = {}
+        for yahoo_symbol, listing in yahoo_symbols.items():
+            if isinstance(data.columns, pd.MultiIndex):
+                if yahoo_symbol not in data.columns.get_level_values(0):
+                    continue
+                closes = data[yahoo_symbol]["Close"]
+            else:
+                closes = data["Close"]
+            
+            closes = closes.dropna()
+            if closes.empty:
+                logger.warning(f"No history for {yahoo_symbol}")
+                continue
+            # Align on calendar dates regardless of exchange timezone
+            closes.index = pd.to_datetime(closes.index).tz_localize(None).normalize()
+            results[listing] = closes
         return results
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""
+Load generator for the MyFinStocks API.
+
+Drives the real FastAPI app with a configurable mix of dashboard traffic and
+reports throughput, p50/p95/p99 latency and error rate per route.
+
+Usage (from the backend directory, against a scratch database):
+    python loadtest.py --seed --clients 500 --holdings 15 --users 50 --duration 60
+    python loadtest.py --mode server --mix dashboard=10,client=70,search=10,pdf=5,refresh=5
+    python loadtest.py --url http://localhost:8000 --duration 30
+    python loadtest.py --cleanup
+
+Modes:
+    inprocess  requests go straight to the ASGI app (no network), yfinance stubbed
+    server     the app is served by uvicorn on a local port in this process, yfinance stubbed
+    --url      an already running server; nothing is stubbed there
+
+Seeded clients use the @loadtest.invalid email domain and synthetic LT#### symbols so
+--cleanup removes only them.
+Requires httpx (pip install httpx).
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+from sqlalchemy import insert, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.database import SessionLocal
+from app.models import Client, Holding, PriceCache
+from app.config import settings
+from app.services.stock_service import StockPriceService
+from app.services.portfolio_totals_service import PortfolioTotalsService
+
+SEED_EMAIL_DOMAIN = "loadtest.invalid"
+DEFAULT_MIX = "dashboard=10,client=60,search=15,pdf=5,refresh=10"
+
+# ===== SYNTHETIC DATA =====
+# Matches synthetic_symbols() exactly, so real tickers such as LT are never touched
+SYNTHETIC_SYMBOL_PATTERN = "^LT[0-9]{4}$"
+
+def synthetic_symbols(count: int) -> List[str]:
+    return [f"LT{i:04d}" for i in range(count)]
+
+def synthetic_prices(symbol: str) -> Dict:
+    """Deterministic base price per symbol with a little noise on every call"""
+    base = 50 + (sum(map(ord, symbol)) * 37) % 4000
+    live = base * random.uniform(0.97, 1.03)
+    return {
+        "symbol": symbol,
+        "live_price": Decimal(str(round(live, 2))),
+        "yesterday_price": Decimal(str(round(base, 2))),
+        "price_30d_ago": Decimal(str(round(base * 0.95, 2))),
+        "price_1y_ago": Decimal(str(round(base * 0.8, 2))),
+    }
+
+def stub_yfinance():
+    """Replace Yahoo Finance calls with synthetic data for this process"""
+    def fetch_stock_prices(symbol: str, exchange: str = "NSE") -> Optional[Dict]:
+        return {**synthetic_prices(symbol), "exchange": exchange}
+
+    def fetch_intraday_bars(listings, interval: str = "5m"):
+        now = int(time.time())
+        results = {}
+        for symbol, exchange in listings:
+            live = float(synthetic_prices(symbol)["live_price"])
+            results[(symbol, exchange)] = {
+                "timestamps": np.arange(now - 300 * 10, now, 300, dtype=np.int64),
+                "closes": live * np.random.uniform(0.99, 1.01, 10),
+                "volumes": np.random.randint(100, 10000, 10).astype(np.float64),
+            }
+        return results
+
+    StockPriceService.fetch_stock_prices = staticmethod(fetch_stock_prices)
+    StockPriceService.fetch_intraday_bars = staticmethod(fetch_intraday_bars)
+
+def seed(num_clients: int, holdings_per_client: int, num_symbols: int):
+    """Insert synthetic clients, holdings and prices, then rebuild portfolio totals"""
+    symbols = synthetic_symbols(num_symbols)
+    db = SessionLocal()
+    try:
+        prices = [{**synthetic_prices(s), "exchange": "NSE"} for s in symbols]
+        db.execute(pg_insert(PriceCache).on_conflict_do_nothing(), prices)
+
+        run_id = int(time.time())
+        client_ids = db.execute(
+            insert(Client).returning(Client.id),
+            [
+                {"name": f"Load Test Client {i}", "email": f"client{i}.{run_id}@{SEED_EMAIL_DOMAIN}"}
+                for i in range(num_clients)
+            ]
+        ).scalars().all()
+
+        holdings = []
+        for client_id in client_ids:
+            for symbol in random.sample(symbols, min(holdings_per_client, len(symbols))):
+                holdings.append({
+                    "client_id": client_id,
+                    "symbol": symbol,
+                    "company_name": f"{symbol} Industries Ltd",
+                    "quantity": random.randint(1, 500),
+                    "exchange": "NSE",
+                })
+        db.execute(insert(Holding), holdings)
+
+        PortfolioTotalsService.rebuild(db)
+        db.commit()
+        print(f"Seeded {len(client_ids)} clients, {len(holdings)} holdings, {len(symbols)} symbols")
+    finally:
+        db.close()
+
+def cleanup():
+    """Delete every seeded client (holdings cascade) and the synthetic prices nobody holds any more"""
+    db = SessionLocal()
+    try:
+        result = db.execute(delete(Client).where(Client.email.like(f"%@{SEED_EMAIL_DOMAIN}")))
+        prices = db.execute(delete(PriceCache).where(
+            PriceCache.symbol.regexp_match(SYNTHETIC_SYMBOL_PATTERN),
+            PriceCache.symbol.not_in(select(Holding.symbol))
+        ))
+        db.commit()
+        print(f"Removed {result.rowcount} load test clients and {prices.rowcount} synthetic prices")
+    finally:
+        db.close()
+
+def load_targets() -> Dict[str, list]:
+    """
+    Client ids and symbols to aim requests at: only seeded clients and
+    synthetic symbols when any were seeded, so stubbed refreshes never
+    overwrite real prices.
+    """
+    db = SessionLocal()
+    try:
+        seeded = [c.id for c in db.query(Client.id).filter(Client.email.like(f"%@{SEED_EMAIL_DOMAIN}")).all()]
+        query = db.query(Holding.symbol).distinct()
+        if seeded:
+            query = query.filter(Holding.symbol.regexp_match(SYNTHETIC_SYMBOL_PATTERN))
+        return {
+            "client_ids": seeded or [c.id for c in db.query(Client.id).all()],
+            "symbols": [s for (s,) in query.all()],
+            "synthetic": bool(seeded),
+        }
+    finally:
+        db.close()
+
+# ===== TRAFFIC =====
+ROUTES = ("dashboard", "client", "search", "pdf", "refresh")
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - set(ROUTES)
+    if unknown:
+        raise SystemExit(f"Unknown routes in mix: {', '.join(sorted(unknown))} (choose from {', '.join(ROUTES)})")
+    return weights
+
+def request_for(route: str, targets: Dict[str, list]):
+    """(method, path) for one request of the given route type"""
+    prefix = settings.API_PREFIX
+    if route == "dashboard":
+        return "GET", f"{prefix}/portfolio/dashboard"
+    if route == "client":
+        return "GET", f"{prefix}/portfolio/client/{random.choice(targets['client_ids'])}"
+    if route == "search":
+        return "GET", f"{prefix}/holdings/stocks/search?query={random.choice(targets['symbols'])[:4]}"
+    if route == "pdf":
+        return "GET", f"{prefix}/portfolio/export/{random.choice(targets['client_ids'])}"
+    return "POST", f"{prefix}/prices/refresh/{random.choice(targets['symbols'])}"
+
+async def virtual_user(client, weights, targets, deadline, stats):
+    routes = list(weights)
+    route_weights = [weights[r] for r in routes]
+    while time.perf_counter() < deadline:
+        route = random.choices(routes, route_weights)[0]
+        method, path = request_for(route, targets)
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path)
+            ok = response.status_code < 400
+        except Exception:
+            # Transport failures and (in-process) unhandled app errors both count against the route
+            ok = False
+        stats[route]["latencies"].append(time.perf_counter() - started)
+        stats[route]["errors"] += 0 if ok else 1
+
+async def run_load(client, users: int, duration: float, weights, targets):
+    stats = defaultdict(lambda: {"latencies": [], "errors": 0})
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(client, weights, targets, deadline, stats) for _ in range(users)))
+    return stats, time.perf_counter() - started
+
+def report(stats, elapsed: float):
+    header = f"{'route':<10} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    all_latencies = []
+    total_errors = 0
+    for route in ROUTES:
+        if route not in stats:
+            continue
+        latencies = np.array(stats[route]["latencies"]) * 1000
+        errors = stats[route]["errors"]
+        all_latencies.extend(latencies)
+        total_errors += errors
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"{route:<10} {len(latencies):>9} {len(latencies) / elapsed:>8.1f} "
+              f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {errors / len(latencies):>7.1%}")
+    if all_latencies:
+        p50, p95, p99 = np.percentile(all_latencies, [50, 95, 99])
+        print("-" * len(header))
+        print(f"{'total':<10} {len(all_latencies):>9} {len(all_latencies) / elapsed:>8.1f} "
+              f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {total_errors / len(all_latencies):>7.1%}")
+
+def start_local_server(app, port: int):
+    """Serve the app with uvicorn on a background thread and wait until it is up"""
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+async def main_async(args, targets):
+    weights = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+            return await run_load(client, args.users, args.duration, weights, targets)
+
+    from app.main import app
+    if args.mode == "server":
+        server, thread = start_local_server(app, args.port)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=timeout) as client:
+                return await run_load(client, args.users, args.duration, weights, targets)
+        finally:
+            server.should_exit = True
+            thread.join()
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+        return await run_load(client, args.users, args.duration, weights, targets)
+
+def main():
+    parser = argparse.ArgumentParser(description="MyFinStocks API load generator")
+    parser.add_argument("--mode", choices=["inprocess", "server"], default="inprocess")
+    parser.add_argument("--url", help="Target an already running server instead (no stubbing)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --mode server")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Run time in seconds")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Route weights (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", action="store_true", help="Insert synthetic clients before running")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--holdings", type=int, default=15, help="Holdings per seeded client")
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--cleanup", action="store_true", help="Delete seeded data and exit")
+    args = parser.parse_args()
+
+    if httpx is None:
+        raise SystemExit("loadtest requires httpx: pip install httpx")
+
+    if args.cleanup:
+        cleanup()
+        return
+    if not args.url:
+        stub_yfinance()
+        # The app's poller would otherwise process any pending real refresh shards with stubbed prices
+        settings.PRICE_REFRESH_POLL_SECONDS = 0
+    if args.seed:
+        seed(args.clients, args.holdings, args.symbols)
+
+    targets = load_targets()
+    if not targets["client_ids"] or not targets["symbols"]:
+        raise SystemExit("No clients/holdings to target; run with --seed first")
+    if not args.url and not targets["synthetic"] and parse_mix(args.mix).get("refresh"):
+        raise SystemExit("Stubbed refresh traffic would overwrite real prices; run with --seed or drop refresh from --mix")
+
+    stats, elapsed = asyncio.run(main_async(args, targets))
+    print(f"\n{args.users} users for {elapsed:.1f}s ({args.url or args.mode})\n")
+    report(stats, elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+-- Incrementally maintained per-client totals (see app/services/portfolio_totals_service.py)
+
+CREATE INDEX IF NOT EXISTS ix_holdings_symbol ON holdings (symbol);
+
+CREATE TABLE IF NOT EXISTS client_portfolio_totals (
+    client_id BIGINT PRIMARY KEY REFERENCES clients (id) ON DELETE CASCADE,
+    current_value NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    yesterday_value NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    value_30d_ago NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    value_1y_ago NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    num_holdings INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Backfill from the existing view
+INSERT INTO client_portfolio_totals (
+    client_id, current_value, yesterday_value, value_30d_ago,
+    value_1y_ago, num_holdings, updated_at
+)
+SELECT c.id,
+       COALESCE(SUM(v.current_value), 0),
+       COALESCE(SUM(v.yesterday_value), 0),
+       COALESCE(SUM(v.value_30d_ago), 0),
+       COALESCE(SUM(v.value_1y_ago), 0),
+       COUNT(v.id),
+       NOW()
+FROM clients c
+LEFT JOIN portfolio_view v ON v.client_id = c.id
+GROUP BY c.id
+ON CONFLICT (client_id) DO NOTHING;
@@ -0,0 +1,31 @@
+-- Price / portfolio threshold alerts (see app/services/alert_service.py)
+
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id BIGSERIAL PRIMARY KEY,
+    scope TEXT NOT NULL CONSTRAINT check_alert_scope_valid CHECK (scope IN ('symbol', 'client')),
+    symbol TEXT,
+    client_id BIGINT REFERENCES clients (id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    direction TEXT NOT NULL CONSTRAINT check_alert_direction_valid CHECK (direction IN ('above', 'below')),
+    threshold NUMERIC(18, 2) NOT NULL,
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    last_triggered_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS alert_events (
+    id BIGSERIAL PRIMARY KEY,
+    rule_id BIGINT NOT NULL REFERENCES alert_rules (id) ON DELETE CASCADE,
+    client_id BIGINT REFERENCES clients (id) ON DELETE CASCADE,
+    symbol TEXT,
+    metric TEXT NOT NULL,
+    observed_value NUMERIC(18, 2) NOT NULL,
+    threshold NUMERIC(18, 2) NOT NULL,
+    message TEXT NOT NULL,
+    triggered_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_alert_events_rule_id ON alert_events (rule_id);
+CREATE INDEX IF NOT EXISTS ix_alert_events_client_id ON alert_events (client_id);
+CREATE INDEX IF NOT EXISTS ix_alert_events_triggered_at ON alert_events (triggered_at);
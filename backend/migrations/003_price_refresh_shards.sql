@@ -0,0 +1,32 @@
+-- Sharded, lease-based price refresh (see app/services/refresh_service.py)
+
+CREATE TABLE IF NOT EXISTS price_refresh_runs (
+    id BIGSERIAL PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'running',
+    total_shards INTEGER NOT NULL,
+    total_symbols INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS price_refresh_shards (
+    id BIGSERIAL PRIMARY KEY,
+    run_id BIGINT NOT NULL REFERENCES price_refresh_runs (id) ON DELETE CASCADE,
+    shard_no INTEGER NOT NULL,
+    listings JSON NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending'
+        CONSTRAINT check_shard_status_valid CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    lease_owner TEXT,
+    lease_expires_at TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_price_refresh_shards_run_id ON price_refresh_shards (run_id);
+CREATE INDEX IF NOT EXISTS ix_price_refresh_shards_claimable
+    ON price_refresh_shards (run_id, shard_no)
+    WHERE status IN ('pending', 'running');
@@ -0,0 +1,17 @@
+-- Per-client change versions for delta-sync (GET /portfolio/client/{id}/changes)
+
+ALTER TABLE client_portfolio_totals ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE holdings ADD COLUMN IF NOT EXISTS change_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS ix_holdings_client_change_version ON holdings (client_id, change_version);
+
+CREATE TABLE IF NOT EXISTS holding_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    holding_id BIGINT NOT NULL,
+    client_id BIGINT NOT NULL REFERENCES clients (id) ON DELETE CASCADE,
+    symbol TEXT NOT NULL,
+    version BIGINT NOT NULL,
+    deleted_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_holding_tombstones_client_version ON holding_tombstones (client_id, version);
@@ -0,0 +1,70 @@
+-- Key price_cache by listing (symbol, exchange) with a stale flag (see app/services/price_cache_service.py)
+
+BEGIN;
+
+ALTER TABLE price_cache ADD COLUMN IF NOT EXISTS is_stale BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE price_cache SET exchange = 'NSE' WHERE exchange IS NULL;
+ALTER TABLE price_cache ALTER COLUMN exchange SET DEFAULT 'NSE';
+ALTER TABLE price_cache ALTER COLUMN exchange SET NOT NULL;
+
+ALTER TABLE price_cache DROP CONSTRAINT IF EXISTS price_cache_pkey;
+ALTER TABLE price_cache ADD PRIMARY KEY (symbol, exchange);
+
+-- Value each holding from its own listing, falling back to the symbol's other
+-- listing when its own row is missing or stale
+DROP VIEW IF EXISTS portfolio_view;
+CREATE VIEW portfolio_view AS
+SELECT h.id,
+       h.client_id,
+       h.symbol,
+       h.company_name,
+       h.exchange,
+       h.quantity,
+       p.live_price,
+       p.yesterday_price,
+       p.price_30d_ago,
+       p.price_1y_ago,
+       h.quantity * p.live_price AS current_value,
+       h.quantity * p.yesterday_price AS yesterday_value,
+       h.quantity * p.price_30d_ago AS value_30d_ago,
+       h.quantity * p.price_1y_ago AS value_1y_ago,
+       h.quantity * (p.live_price - p.yesterday_price) AS day_change,
+       ROUND((p.live_price - p.yesterday_price) / NULLIF(p.yesterday_price, 0) * 100, 2) AS day_change_percent,
+       p.exchange AS price_exchange,
+       p.last_updated AS price_updated_at
+FROM holdings h
+LEFT JOIN LATERAL (
+    SELECT *
+    FROM price_cache pc
+    WHERE pc.symbol = h.symbol
+    ORDER BY (pc.live_price IS NOT NULL AND NOT pc.is_stale) DESC,
+             (pc.exchange = COALESCE(h.exchange, 'NSE')) DESC
+    LIMIT 1
+) p ON TRUE;
+
+-- Holdings may now be valued from a different row than before; resync totals
+INSERT INTO client_portfolio_totals (
+    client_id, current_value, yesterday_value, value_30d_ago,
+    value_1y_ago, num_holdings, updated_at
+)
+SELECT c.id,
+       COALESCE(SUM(v.current_value), 0),
+       COALESCE(SUM(v.yesterday_value), 0),
+       COALESCE(SUM(v.value_30d_ago), 0),
+       COALESCE(SUM(v.value_1y_ago), 0),
+       COUNT(v.id),
+       NOW()
+FROM clients c
+LEFT JOIN portfolio_view v ON v.client_id = c.id
+GROUP BY c.id
+ON CONFLICT (client_id) DO UPDATE SET
+    current_value = EXCLUDED.current_value,
+    yesterday_value = EXCLUDED.yesterday_value,
+    value_30d_ago = EXCLUDED.value_30d_ago,
+    value_1y_ago = EXCLUDED.value_1y_ago,
+    num_holdings = EXCLUDED.num_holdings,
+    version = client_portfolio_totals.version + 1,
+    updated_at = EXCLUDED.updated_at;
+
+COMMIT;
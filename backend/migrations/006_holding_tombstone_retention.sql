@@ -0,0 +1,5 @@
+-- Tombstone retention for delta-sync (PortfolioTotalsService.prune_tombstones)
+
+ALTER TABLE client_portfolio_totals ADD COLUMN IF NOT EXISTS tombstones_pruned_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS ix_holding_tombstones_deleted_at ON holding_tombstones (deleted_at);
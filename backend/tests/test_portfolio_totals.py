@@ -0,0 +1,163 @@
+"""
+client_portfolio_totals must always equal what rebuild() recomputes from
+portfolio_view, however holdings and prices are written.
+
+Needs a scratch PostgreSQL database (advisory locks, upserts, the view):
+    TEST_DATABASE_URL=postgresql://... python -m pytest tests
+Its public schema is dropped and recreated from the models and migrations.
+"""
+import os
+import threading
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if not TEST_DATABASE_URL or not TEST_DATABASE_URL.startswith("postgresql"):
+    pytest.skip("TEST_DATABASE_URL must point at a scratch PostgreSQL database", allow_module_level=True)
+
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+os.environ["PRICE_REFRESH_POLL_SECONDS"] = "0"
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.database import Base, SessionLocal, engine
+from app.main import app
+from app.services.portfolio_totals_service import PortfolioTotalsService
+from app.services.refresh_service import PriceRefreshService
+
+MIGRATIONS = Path(__file__).resolve().parent.parent / "migrations"
+TOTALS_COLUMNS = ("current_value", "yesterday_value", "value_30d_ago", "value_1y_ago", "num_holdings")
+API = "/api/v1"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def schema():
+    with engine.begin() as conn:
+        conn.execute(text("DROP SCHEMA public CASCADE"))
+        conn.execute(text("CREATE SCHEMA public"))
+    Base.metadata.create_all(engine)
+    raw = engine.raw_connection()
+    try:
+        raw.autocommit = True
+        cursor = raw.cursor()
+        # 005 defines portfolio_view, which 001 backfills from
+        for path in sorted(MIGRATIONS.glob("*.sql"), key=lambda p: (p.name != "005_price_cache_listing_key.sql", p.name)):
+            cursor.execute(path.read_text())
+    finally:
+        raw.close()
+
+
+@pytest.fixture(autouse=True)
+def empty_tables(schema):
+    tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+
+@pytest.fixture
+def api():
+    return TestClient(app)
+
+
+def totals_snapshot(db):
+    rows = db.execute(text(f"""
+        SELECT client_id, {", ".join(TOTALS_COLUMNS)}
+        FROM client_portfolio_totals ORDER BY client_id
+    """)).fetchall()
+    return {row.client_id: tuple(row[1:]) for row in rows}
+
+
+def assert_totals_match_rebuild():
+    db = SessionLocal()
+    try:
+        maintained = totals_snapshot(db)
+        PortfolioTotalsService.rebuild(db)
+        rebuilt = totals_snapshot(db)
+        db.rollback()
+    finally:
+        db.close()
+    for client_id, values in rebuilt.items():
+        assert maintained.get(client_id, (Decimal(0),) * 4 + (0,)) == values, f"client {client_id} drifted"
+
+
+def set_price(api, symbol, live, exchange="NSE", yesterday=None):
+    payload = {"symbol": symbol, "exchange": exchange, "live_price": str(live)}
+    if yesterday is not None:
+        payload.update(yesterday_price=str(yesterday), price_30d_ago=str(yesterday), price_1y_ago=str(yesterday))
+    response = api.post(f"{API}/prices/update", json=payload)
+    assert response.status_code == 200, response.text
+
+
+def add_client(api, name):
+    response = api.post(f"{API}/clients/", json={"name": name})
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def add_holding(api, client_id, symbol, quantity, exchange="NSE"):
+    response = api.post(f"{API}/holdings/", json={
+        "client_id": client_id, "symbol": symbol, "company_name": symbol,
+        "quantity": quantity, "exchange": exchange,
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["id"]
+
+
+def test_deltas_match_rebuild_through_every_write_path(api):
+    set_price(api, "INFY", "1500.00", yesterday="1490.00")
+    set_price(api, "INFY", "1501.00", exchange="BSE", yesterday="1489.00")
+    set_price(api, "TCS", "3500.00", yesterday="3450.00")
+
+    alice = add_client(api, "Alice")
+    bob = add_client(api, "Bob")
+    infy_nse = add_holding(api, alice, "INFY", 10)
+    add_holding(api, alice, "TCS", 3)
+    infy_bse = add_holding(api, bob, "INFY", 7, exchange="BSE")
+    # No price yet: counted at zero until one arrives
+    add_holding(api, bob, "WIPRO", 20)
+    assert_totals_match_rebuild()
+
+    assert api.put(f"{API}/holdings/{infy_nse}", json={"quantity": 25}).status_code == 200
+    assert_totals_match_rebuild()
+
+    set_price(api, "INFY", "1525.50")
+    set_price(api, "WIPRO", "450.00", yesterday="440.00")
+    assert_totals_match_rebuild()
+
+    # A failed BSE fetch moves Bob's BSE holding onto the NSE listing, and back on success
+    db = SessionLocal()
+    try:
+        PriceRefreshService.mark_stale(db, "INFY", "BSE")
+        db.commit()
+    finally:
+        db.close()
+    assert_totals_match_rebuild()
+    set_price(api, "INFY", "1530.00", exchange="BSE")
+    assert_totals_match_rebuild()
+
+    assert api.delete(f"{API}/holdings/{infy_bse}").status_code == 204
+    assert_totals_match_rebuild()
+
+
+def test_concurrent_writers_do_not_drift(api):
+    set_price(api, "INFY", "1500.00", yesterday="1490.00")
+    client_id = add_client(api, "Carol")
+    holding_id = add_holding(api, client_id, "INFY", 10)
+
+    def update_quantity(quantity):
+        TestClient(app).put(f"{API}/holdings/{holding_id}", json={"quantity": quantity})
+
+    def update_price(price):
+        set_price(TestClient(app), "INFY", price)
+
+    threads = [threading.Thread(target=update_quantity, args=(q,)) for q in range(11, 31)]
+    threads += [threading.Thread(target=update_price, args=(f"{1500 + i}.00",)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert_totals_match_rebuild()